@@ -0,0 +1,168 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.stats import chi2
+
+from distributions import MultivariateNormal
+from divergence_utils import kl_estimate
+from partition import (AdaptiveAlgorithm, BatchedAdaptiveAlgorithm, HistogramPartition, NonAdaptivePartition, Plane,
+                       RankAdaptiveAlgorithm)
+
+
+SIZES = [1000, 10000, 100000, 1000000]
+RS_VALUES = [(2, 2), (4, 4), (2, 4)]
+ENGINES = {
+    "AdaptiveAlgorithm": AdaptiveAlgorithm,
+    "RankAdaptiveAlgorithm": RankAdaptiveAlgorithm,
+    "BatchedAdaptiveAlgorithm": BatchedAdaptiveAlgorithm,
+    "NonAdaptivePartition": NonAdaptivePartition,
+    "HistogramPartition": HistogramPartition,
+}
+# Reference engines scan the whole sample per rectangle, larger sizes take minutes
+MAX_SIZE = {"AdaptiveAlgorithm": 100000, "RankAdaptiveAlgorithm": 100000, "NonAdaptivePartition": 10000}
+
+
+def delta(x):
+    return chi2.ppf(0.97, x ** 2 - 1)
+
+
+def measure(func, repeat=5, warmup=1):
+    """Time ``func`` with ``perf_counter`` and measure its peak traced memory.
+
+    ``warmup`` untimed calls come first, then ``repeat`` timed calls; the peak
+    memory comes from one more call under ``tracemalloc``, so tracing does
+    not slow down the timed calls.
+    """
+    for _ in range(warmup):
+        func()
+
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+
+    finally:
+        tracemalloc.stop()
+
+    return {"times": times, "min": min(times), "median": float(np.median(times)), "mean": float(np.mean(times)),
+            "peak_memory": peak}
+
+
+def benchmark_cases(sizes, engines, rs_values, bins):
+    """Yield ``(name, params, func)`` for every benchmark of the suite."""
+    for size in sizes:
+        dist = MultivariateNormal(mean=np.zeros(2), cov=np.array([[1., 0.6], [0.6, 1.]]))
+        np.random.seed(size)
+        sample = dist.sample(size)
+
+        # Benchmarks are run as they are yielded, closures can use the loop variables
+        yield "sample", {"n": size}, lambda: dist.sample(size)
+
+        for engine in engines:
+            if size > MAX_SIZE.get(engine, size):
+                continue
+
+            algorithm = ENGINES[engine]
+            if issubclass(algorithm, NonAdaptivePartition):
+                params = {"engine": engine, "n": size, "bins": bins}
+                yield "run", params, lambda: algorithm(sample, bins=[bins, bins]).run()
+                continue
+
+            for r, s in rs_values:
+                yield "run", {"engine": engine, "n": size, "r": r, "s": s}, lambda: algorithm(sample, delta, r, s).run()
+
+        partition = BatchedAdaptiveAlgorithm(sample, delta, 2, 2).run()
+        grid = HistogramPartition(sample, bins=[bins, bins]).run()
+
+        yield "kl_estimate", {"partition": "adaptive", "n": size}, lambda: kl_estimate(Plane(sample), partition)
+        yield "kl_estimate", {"partition": "grid", "n": size}, lambda: kl_estimate(Plane(sample), grid)
+
+
+def run_suite(sizes=SIZES, engines=tuple(ENGINES), rs_values=RS_VALUES, bins=50, repeat=5, warmup=1, verbose=True):
+    results = []
+    for name, params, func in benchmark_cases(sizes, engines, rs_values, bins):
+        result = {"name": name, "params": params, **measure(func, repeat=repeat, warmup=warmup)}
+        results.append(result)
+
+        if verbose:
+            print(f"{benchmark_key(result):<80} median {result['median']:.6f} s, "
+                  f"peak {result['peak_memory'] / 2 ** 20:.2f} MiB", flush=True)
+
+    return {
+        "meta": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": repeat, "warmup": warmup},
+        "results": results,
+    }
+
+
+def benchmark_key(result):
+    return result["name"] + " " + json.dumps(result["params"], sort_keys=True)
+
+
+def compare(current, baseline, threshold=1.25):
+    """Median time ratios against a baseline, flagging those above ``threshold``.
+
+    Returns a list of ``(key, baseline median, current median, ratio, slower)``
+    for the benchmarks present in both runs.
+    """
+    baseline_medians = {benchmark_key(result): result["median"] for result in baseline["results"]}
+
+    comparison = []
+    for result in current["results"]:
+        key = benchmark_key(result)
+        if key in baseline_medians:
+            ratio = result["median"] / baseline_medians[key]
+            comparison.append((key, baseline_medians[key], result["median"], ratio, ratio > threshold))
+
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite of the MI estimators.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument("--rs", type=int, nargs=2, action="append", metavar=("R", "S"),
+                        help="(r, s) values of the adaptive engines, can be repeated")
+    parser.add_argument("--bins", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of a baseline run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="flag benchmarks whose median time exceeds the baseline by this factor")
+    args = parser.parse_args()
+
+    results = run_suite(args.sizes, args.engines, [tuple(rs) for rs in args.rs] if args.rs else RS_VALUES,
+                        args.bins, args.repeat, args.warmup)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        slowdowns = 0
+        for key, base_median, median, ratio, slower in compare(results, baseline, args.threshold):
+            slowdowns += slower
+            print(f"{'SLOWER' if slower else 'ok':<7}{key:<80} {base_median:.6f} s -> {median:.6f} s ({ratio:.2f}x)")
+
+        if slowdowns:
+            print(f"{slowdowns} benchmark(s) slower than the baseline by more than {args.threshold}x")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import norm
+
+from divergence_utils import kl_estimate
+from mi_matrix import attach_arrays, shared_arrays
+from partition import BatchedAdaptiveAlgorithm, Plane, tabulate_delta
+
+
+class ResampleEstimator:
+    """Adaptive partition MI estimate of subsamples of a sample, sorted once for all of them.
+
+    A subsample is given by its boolean ``keep`` mask over the samples. The
+    estimate only depends on the order of the samples along each marginal,
+    so subsamples are estimated in rank space: ``order`` holds the
+    permutations sorting the marginals of the sample and ``position`` the
+    position of every sample in them, from which the ranks of any subsample
+    are derived in linear time, without sorting again, see ``plane``.
+    """
+
+    def __init__(self, sample, delta, r, s, log_base, order=None, position=None):
+        self.sample = sample
+        self.delta = delta
+        self.r = r
+        self.s = s
+        self.log_base = log_base
+
+        if order is None:
+            order = np.argsort(sample, axis=0, kind='stable').T
+            position = np.empty_like(order)
+            np.put_along_axis(position, order, np.arange(len(sample)), axis=1)
+
+        self.order = order
+        self.position = position
+
+    @classmethod
+    def from_sample(cls, sample, delta, r, s, log_base):
+        return cls(np.ascontiguousarray(sample, dtype=np.float64), delta, r, s, log_base)
+
+    def plane(self, keep):
+        """Plane of the subsample ``sample[keep]``, with samples replaced by their ranks."""
+        ranks = []
+        for order, position in zip(self.order, self.position):
+            # Kept samples before every position of the sorted sample
+            below = np.concatenate(([0], np.cumsum(keep[order])))
+            ranks.append(below[position[keep]])
+
+        marginal = np.arange(np.count_nonzero(keep), dtype=np.float64)
+        return Plane(np.column_stack(ranks).astype(np.float64), sorted_marginals=(marginal, marginal),
+                     ranks=tuple(ranks))
+
+    def __call__(self, keep):
+        plane = self.plane(keep)
+        partition = BatchedAdaptiveAlgorithm(plane.sample, self.delta, self.r, self.s, plane=plane).run()
+        return kl_estimate(plane, partition, log_base=self.log_base)
+
+    def half_sample(self, seed, size):
+        """Estimate of the subsample of ``size`` samples drawn without replacement given by ``seed``."""
+        keep = np.zeros(len(self.sample), dtype=bool)
+        keep[np.random.default_rng(seed).permutation(len(self.sample))[:size]] = True
+        return self(keep)
+
+    def jackknife(self, groups, group):
+        """Estimate of the sample without the samples of ``group``."""
+        return self(groups != group)
+
+
+class BootstrapResult:
+    """MI estimate of a sample, its bootstrap replicates and confidence interval."""
+
+    def __init__(self, estimate, replicates, interval, confidence, method):
+        self.estimate = estimate
+        self.replicates = replicates
+        self.interval = interval
+        self.confidence = confidence
+        self.method = method
+
+    @property
+    def standard_error(self):
+        return np.std(self.replicates, ddof=1)
+
+    def as_dict(self):
+        return {"estimate": self.estimate, "low": self.interval[0], "high": self.interval[1],
+                "standard_error": self.standard_error, "confidence": self.confidence, "method": self.method}
+
+
+def percentile_interval(replicates, confidence):
+    alpha = (1 - confidence) / 2
+    return tuple(np.quantile(replicates, [alpha, 1 - alpha]))
+
+
+def bca_interval(replicates, estimate, jackknife, confidence):
+    """Bias-corrected and accelerated interval, the acceleration from jackknife estimates."""
+    z0 = norm.ppf(np.mean(replicates < estimate))
+    deviation = np.mean(jackknife) - jackknife
+    with np.errstate(divide='ignore', invalid='ignore'):
+        acceleration = np.sum(deviation ** 3) / (6 * np.sum(deviation ** 2) ** 1.5)
+
+    if not np.isfinite(z0) or not np.isfinite(acceleration):
+        # Every replicate on one side of the estimate, or a constant jackknife
+        return percentile_interval(replicates, confidence)
+
+    alpha = (1 - confidence) / 2
+    z = z0 + norm.ppf([alpha, 1 - alpha])
+    return tuple(np.quantile(replicates, norm.cdf(z0 + z / (1 - acceleration * z))))
+
+
+_estimator = None
+_groups = None
+
+
+def _attach_worker(blocks, delta, r, s, log_base):
+    """Process pool initializer, maps the shared sample of the parent."""
+    global _estimator, _groups
+    sample, order, position, _groups = attach_arrays(blocks)
+    _estimator = ResampleEstimator(sample, delta, r, s, log_base, order, position)
+
+
+def _worker_half_sample(seed, size):
+    return _estimator.half_sample(seed, size)
+
+
+def _worker_jackknife(group):
+    return _estimator.jackknife(_groups, group)
+
+
+def bootstrap(sample, delta, r=2, s=2, n_resamples=1000, confidence=0.95, method='percentile',
+              jackknife_groups=100, log_base=np.exp(1), seed=None, workers=None, chunksize=16):
+    """Half-sampling bootstrap confidence interval of the adaptive partition MI estimate of ``sample``.
+
+    Resamples are halves of the sample drawn without replacement, each from
+    a child of ``seed``: drawing with replacement repeats samples, and
+    repeated points are clusters the adaptive partition takes for
+    dependence (or cells it can never split), while the estimate on a half
+    sample has about the variance of the estimate on the whole sample. The
+    sample is sorted once and every resample derives its ranks from it (see
+    ``ResampleEstimator``) before its partition is built by
+    ``BatchedAdaptiveAlgorithm``. ``method`` is ``'percentile'`` or
+    ``'bca'``, whose acceleration is estimated by a
+    delete-a-group jackknife over ``jackknife_groups`` random groups (one
+    sample per group when the sample is smaller). With ``workers`` the
+    resamples are spread over a process pool that maps the sample, its
+    orders and positions from shared memory.
+    """
+    if method not in ('percentile', 'bca'):
+        raise ValueError(f"Unknown interval method {method!r}, expected 'percentile' or 'bca'")
+
+    delta = tabulate_delta(delta, s)
+    estimator = ResampleEstimator.from_sample(sample, delta, r, s, log_base)
+    n = len(estimator.sample)
+    sizes = [n // 2] * n_resamples
+
+    seeds = np.random.SeedSequence(seed).spawn(n_resamples + 1)
+    n_groups = min(jackknife_groups, n) if method == 'bca' else 0
+    groups = np.random.default_rng(seeds[-1]).permutation(n) % max(n_groups, 1)
+
+    if workers is None or workers <= 1:
+        replicates = np.array([estimator.half_sample(child, n // 2) for child in seeds[:-1]])
+        jackknife = np.array([estimator.jackknife(groups, group) for group in range(n_groups)])
+
+    else:
+        arrays = [estimator.sample, estimator.order, estimator.position, groups]
+        with shared_arrays(arrays) as blocks:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker,
+                                     initargs=(blocks, delta, r, s, log_base)) as executor:
+                replicates = np.array(list(executor.map(_worker_half_sample, seeds[:-1], sizes, chunksize=chunksize)))
+                jackknife = np.array(list(executor.map(_worker_jackknife, range(n_groups), chunksize=chunksize)))
+
+    estimate = estimator(np.ones(n, dtype=bool))
+    if method == 'bca':
+        interval = bca_interval(replicates, estimate, jackknife, confidence)
+
+    else:
+        interval = percentile_interval(replicates, confidence)
+
+    return BootstrapResult(estimate, replicates, interval, confidence, method)
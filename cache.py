@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from partition import Partition
+
+# Bump whenever a change to the engines can change a partition, old entries are then never hit
+ENGINE_VERSION = 1
+
+
+class PartitionCache:
+    """On-disk cache of fitted partitions and their MI estimates, addressed by content.
+
+    An entry is keyed by a SHA-256 hash of the sample bytes (with its shape
+    and dtype) and of the estimation parameters, e.g. ``r``, ``s``, the
+    tabulated ``delta`` thresholds, ``bins``, the engine and
+    ``ENGINE_VERSION``. It is stored in ``directory`` as a ``.npz`` file
+    holding the partition as arrays (a ``GridPartition`` as its edges and
+    grid) and the estimate. The total size of the entries is capped at
+    ``max_bytes``: the least recently used ones are evicted, recency being
+    the modification time of the files, refreshed on every hit. ``hits`` and
+    ``misses`` count the lookups of this instance (of this process, when it
+    is sent to worker processes).
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(sample, **params):
+        sample = np.ascontiguousarray(sample)
+        digest = hashlib.sha256()
+        digest.update(json.dumps({"shape": sample.shape, "dtype": sample.dtype.str, "engine_version": ENGINE_VERSION,
+                                  **params}, sort_keys=True, default=repr).encode())
+        digest.update(sample.data)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """``(partition, estimate)`` of an entry, None when it is not cached."""
+        path = self.path(key)
+        try:
+            with np.load(path) as entry:
+                partition = Partition.from_arrays(entry)
+                estimate = float(entry["estimate"])
+
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            # Missing, evicted meanwhile by another process, or half written
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.hits += 1
+        return partition, estimate
+
+    def put(self, key, partition, estimate):
+        # Written aside and renamed, readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, estimate=estimate, **partition.to_arrays())
+            os.replace(tmp, self.path(key))
+
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in ``max_bytes``."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def estimate(self, sample, fit, **params):
+        """Estimate of ``sample`` from the cache, or from ``fit(sample)`` -> ``(partition, estimate)``, then cached."""
+        key = self.key(sample, **params)
+        cached = self.get(key)
+        if cached is not None:
+            return cached[1]
+
+        partition, estimate = fit(sample)
+        self.put(key, partition, estimate)
+        return estimate
+
+    @property
+    def size(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith(".npz"))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self), "bytes": self.size}
+
+    def __len__(self):
+        return sum(1 for entry in os.scandir(self.directory) if entry.name.endswith(".npz"))
@@ -1,6 +1,6 @@
-
 # from __future__ import annotations
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union, List, Callable, Tuple
 
 import numpy as np
@@ -9,47 +9,79 @@ import numpy as np
 Num = Union[int, float]
 
 
+class SamplingContext:
+    """State of one draw: the random generator and, when ``keep``, the samples drawn so far.
+
+    ``rng`` is a ``np.random.Generator`` (or anything ``np.random.default_rng``
+    accepts); by default the global NumPy random state is used. With ``keep``
+    every distribution is sampled once per context, so distributions used
+    several times in the draw (e.g. the common variable of ``x`` and ``y`` in
+    a ``Joint``) share their samples. Contexts are per call, so concurrent
+    draws never see each other's samples.
+    """
+
+    def __init__(self, rng=None, keep=False):
+        if rng is None:
+            rng = np.random
+        elif not isinstance(rng, np.random.Generator):
+            rng = np.random.default_rng(rng)
+
+        self.rng = rng
+        self.keep = keep
+        self.sampled = {}
+
+
 class Distribution(ABC):
     """Define a probability distribution."""
-    KEEP = False
 
-    def __init__(self):
-        self.sampled = None
-
-    def sample(self, n: int) -> Union[np.ndarray, list]:
+    def sample(self, n: int, rng=None, context: SamplingContext = None) -> np.ndarray:
         """Method to sample from distribution.
         
         This method shouldn't be overridden, the one to override in order
-        to define the distribution sample is get_sample.
+        to define the distribution sample is get_sample. Samples are drawn
+        from ``rng``, or within ``context`` when given.
         """
-        if self.sampled is not None and Distribution.KEEP:
-            return self.sampled
+        if context is None:
+            context = SamplingContext(rng)
+
+        if not context.keep:
+            return self.get_sample(n, context)
 
-        else:
-            samples = self.get_sample(n)
-            self.sampled = samples if Distribution.KEEP else None
-            return samples
+        if self not in context.sampled:
+            context.sampled[self] = self.get_sample(n, context)
+
+        return context.sampled[self]
+
+    def sample_batch(self, K: int, n: int, rng=None, context: SamplingContext = None) -> np.ndarray:
+        """Draw ``K`` independent samples of size ``n`` at once.
+
+        Samples are i.i.d., so the ``K * n`` draws come out of a single call
+        to ``sample`` and are reshaped to ``(K, n, ...)``.
+        """
+        samples = np.asarray(self.sample(K * n, rng, context))
+        return samples.reshape((K, n) + samples.shape[1:])
 
     @abstractmethod
-    def get_sample(self, n: int) -> Union[np.ndarray, list]:
+    def get_sample(self, n: int, context: SamplingContext) -> np.ndarray:
         """Sample the distribution.
         
         This method has to be overriden by subclasses in order to define
-        the distribution itself.
+        the distribution itself. Random numbers are drawn from
+        ``context.rng`` and other distributions sampled within ``context``.
         """
         raise NotImplementedError("sample not implemented")
 
     @staticmethod
     def multiply(*dists: 'Distribution') -> 'Distribution':
-        return type("MultDist", (Distribution, object), {"get_sample": lambda self, n: np.prod([d.sample(n) for d in dists], axis=0)})()
+        return type("MultDist", (Distribution, object), {"get_sample": lambda self, n, context: np.prod([d.sample(n, context=context) for d in dists], axis=0)})()
 
     @staticmethod
     def sum(*dists: 'Distribution') -> 'Distribution':
-        return type("SumDist", (Distribution, object), {"get_sample": lambda self, n: np.sum([d.sample(n) for d in dists], axis=0)})()
+        return type("SumDist", (Distribution, object), {"get_sample": lambda self, n, context: np.sum([d.sample(n, context=context) for d in dists], axis=0)})()
 
     @staticmethod
     def operation(dist: 'Distribution', oper: Callable) -> 'Distribution':
-        return type("OpDist", (Distribution, object), {"get_sample": lambda self, n: oper(dist.sample(n))})()
+        return type("OpDist", (Distribution, object), {"get_sample": lambda self, n, context: oper(dist.sample(n, context=context))})()
 
 
 class Distribution2D(Distribution):
@@ -60,8 +92,8 @@ class Distribution2D(Distribution):
         self.d1 = d1
         self.d2 = d2
 
-    def get_sample(self, n: int) -> list:
-        return list(zip(self.d1.sample(n), self.d2.sample(n)))
+    def get_sample(self, n: int, context: SamplingContext) -> np.ndarray:
+        return np.column_stack((self.d1.sample(n, context=context), self.d2.sample(n, context=context)))
 
 
 class Uniform(Distribution):
@@ -72,8 +104,8 @@ class Uniform(Distribution):
         self.a = a
         self.b = b
 
-    def get_sample(self, n: int) -> np.ndarray:
-        return np.random.uniform(self.a, self.b, size=n)
+    def get_sample(self, n: int, context: SamplingContext) -> np.ndarray:
+        return context.rng.uniform(self.a, self.b, size=n)
 
 
 class Normal(Distribution):
@@ -84,8 +116,8 @@ class Normal(Distribution):
         self.mean = mean
         self.std = std
 
-    def get_sample(self, n: int) -> np.ndarray:
-        return np.random.normal(self.mean, self.std, size=n)
+    def get_sample(self, n: int, context: SamplingContext) -> np.ndarray:
+        return context.rng.normal(self.mean, self.std, size=n)
 
 
 class MultivariateNormal(Distribution):
@@ -96,8 +128,8 @@ class MultivariateNormal(Distribution):
         self.mean = mean
         self.cov = cov
 
-    def get_sample(self, n: int) -> np.ndarray:
-        return np.random.multivariate_normal(self.mean, self.cov, size=n)
+    def get_sample(self, n: int, context: SamplingContext) -> np.ndarray:
+        return context.rng.multivariate_normal(self.mean, self.cov, size=n)
 
 class BivariatePareto(Distribution):
     """Bivariate Pareto distribution."""
@@ -108,14 +140,14 @@ class BivariatePareto(Distribution):
         self.theta2 = theta2
         self.alpha = alpha
 
-    def get_sample(self, n):
-        u1 = np.random.random(size=n)
-        u2 = np.random.random(size=n)
+    def get_sample(self, n, context):
+        u1 = context.rng.random(size=n)
+        u2 = context.rng.random(size=n)
 
         y = self.theta2 / (u2 ** (1 / self.alpha))
         x = self.theta1 + (self.theta1 / self.theta2) * y * ((1 / (u1 ** (1 / (self.alpha + 1)))) - 1)
 
-        return np.array(list(zip(x, y)))
+        return np.column_stack((x, y))
 
 
 class RandomVar:
@@ -128,9 +160,9 @@ class RandomVar:
     def dist(self):
         return self._dist
 
-    def sample(self, n: int) -> Union[np.ndarray, list]:
+    def sample(self, n: int, rng=None) -> np.ndarray:
         try:
-            return self.dist.sample(n)
+            return self.dist.sample(n, rng)
 
         except AttributeError:
             if self._dist is None:
@@ -139,6 +171,9 @@ class RandomVar:
             else:
                 raise
 
+    def sample_batch(self, K: int, n: int, rng=None) -> np.ndarray:
+        return self.dist.sample_batch(K, n, rng)
+
     @staticmethod
     def multiply(*rvars: 'RandomVar') -> 'RandomVar':
         return RandomVar(Distribution.multiply(*[rvar.dist for rvar in rvars]))
@@ -155,7 +190,9 @@ class RandomVar:
 class Joint(RandomVar):
     """Defines a random variable that has a joint distribution.
     
-    The Joint distribution is defined by two previous random variables.
+    The Joint distribution is defined by two previous random variables,
+    which are sampled within a single ``SamplingContext`` so the
+    distributions they share are drawn once.
     """
 
     def __init__(self, x: RandomVar, y: RandomVar):
@@ -163,12 +200,24 @@ class Joint(RandomVar):
         self._x = x
         self._y = y
     
-    def sample(self, n: int) -> np.ndarray:
-        Distribution.KEEP = True
-        xy = self.dist.sample(n)
-        Distribution.KEEP = False
+    def sample(self, n: int, rng=None) -> np.ndarray:
+        return self.dist.sample(n, context=SamplingContext(rng, keep=True))
 
-        return np.array(xy)
+    def sample_batch(self, K: int, n: int, rng=None) -> np.ndarray:
+        return self.dist.sample_batch(K, n, context=SamplingContext(rng, keep=True))
+
+
+def sample_replicates(rvar, K: int, n: int, seed=None, workers=None) -> np.ndarray:
+    """``K`` samples of size ``n`` of a distribution or random variable, filled in parallel threads.
+
+    Replicate ``k`` is drawn from its own ``np.random.Generator``, seeded by
+    the ``k``-th child of ``np.random.SeedSequence(seed)``, so the result
+    does not depend on ``workers``. NumPy generators release the GIL while
+    drawing, so the threads run concurrently.
+    """
+    generators = [np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(K)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return np.stack(list(executor.map(lambda rng: rvar.sample(n, rng), generators)))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import pearsonr
+
+from distributions import MultivariateNormal
+from divergence_utils import kl_estimate
+from partition import BatchedAdaptiveAlgorithm, HistogramPartition, Plane, tabulate_delta
+
+
+def bivariate_gaussian(rho):
+    """Standard bivariate normal distribution with correlation ``rho``."""
+    return MultivariateNormal(mean=np.zeros(2), cov=np.array([[1., rho], [rho, 1.]]))
+
+
+def gaussian_mi(rho):
+    """Mutual information of the standard bivariate normal with correlation ``rho``."""
+    return - np.log(1 - rho ** 2) / 2
+
+
+class MLEstimator:
+    """Maximum likelihood MI estimate under a bivariate normal model."""
+
+    def __call__(self, sample):
+        return - np.log(1 - pearsonr(sample[:, 0], sample[:, 1])[0] ** 2) / 2
+
+
+class AdaptiveEstimator:
+    """MI estimate on the adaptive partition of the sample.
+
+    With a ``cache.PartitionCache`` estimates are looked up by sample and
+    parameters, the partition is only built on a miss.
+    """
+
+    def __init__(self, delta, r, s, engine=BatchedAdaptiveAlgorithm, cache=None):
+        # Tabulated so the estimator can be sent to worker processes
+        self.delta = tabulate_delta(delta, s)
+        self.r = r
+        self.s = s
+        self.engine = engine
+        self.cache = cache
+
+    def fit(self, sample):
+        plane = Plane(sample)
+        partition = self.engine(sample, self.delta, self.r, self.s, plane=plane).run()
+        return partition, kl_estimate(plane, partition)
+
+    def __call__(self, sample):
+        if self.cache is None:
+            return self.fit(sample)[1]
+
+        return self.cache.estimate(sample, self.fit, method="adaptive", engine=self.engine.__name__, r=self.r,
+                                   s=self.s, delta=[self.delta(self.s), self.delta(self.s ** 2)])
+
+
+class NonAdaptiveEstimator:
+    """MI estimate on the equiprobable product partition of the sample, see ``AdaptiveEstimator`` for ``cache``."""
+
+    def __init__(self, bins, engine=HistogramPartition, cache=None):
+        self.bins = bins
+        self.engine = engine
+        self.cache = cache
+
+    def fit(self, sample):
+        partition = self.engine(sample, bins=self.bins).run()
+        return partition, kl_estimate(Plane(sample), partition)
+
+    def __call__(self, sample):
+        if self.cache is None:
+            return self.fit(sample)[1]
+
+        return self.cache.estimate(sample, self.fit, method="non_adaptive", engine=self.engine.__name__,
+                                   bins=list(self.bins))
+
+
+def draw_replicates(make_dist, rho, sample_size, K, seed):
+    """The ``K`` replicate samples of a cell, drawn with a single ``sample_batch`` call.
+
+    The samples are drawn from a generator on the cell seed sequence, the
+    global NumPy random state of the caller is left untouched.
+    """
+    return make_dist(rho).sample_batch(K, sample_size, rng=np.random.default_rng(seed))
+
+
+def run_replicate(task):
+    """Estimates of every method on one replicate sample.
+
+    A method may return several estimates (e.g. a ``sweep.ConfigurationSweep``),
+    they are flattened in order.
+    """
+    xy_sample, methods = task
+    return [value for method in methods for value in np.atleast_1d(method(xy_sample))]
+
+
+def run_replicates(methods, rhos, sample_sizes, K, seed=0, workers=None, make_dist=bivariate_gaussian, chunksize=4,
+                   store=None, names=None):
+    """Estimates of every method over the (rho, sample size, replicate) grid.
+
+    All methods of a replicate are evaluated on the same sample. The ``K``
+    replicates of cell ``(i, j)`` come out of one vectorized draw from its
+    own stream, seeded by ``np.random.SeedSequence(seed, spawn_key=(i, j))``,
+    so results are bit-identical whatever the number of ``workers`` and the
+    order in which replicates run. Returns an array of shape
+    ``(len(rhos), len(sample_sizes), K, n_estimates)``, with one estimate
+    per method and configuration.
+
+    With a ``store.ResultStore`` every replicate is recorded, under the
+    ``names`` of its estimates, as soon as it completes, and replicates
+    already recorded are read from the store instead of being computed.
+    """
+    if store is not None and names is None:
+        raise ValueError("names of the estimates are needed to record them in a store")
+
+    replicates = [(rho, sample_size, k, xy_sample)
+                  for i, rho in enumerate(rhos) for j, sample_size in enumerate(sample_sizes)
+                  for k, xy_sample in enumerate(draw_replicates(make_dist, rho, sample_size, K,
+                                                                np.random.SeedSequence(seed, spawn_key=(i, j))))]
+    pending = replicates if store is None else [rep for rep in replicates if not store.done(*rep[:3], names)]
+    tasks = [(xy_sample, methods) for *_, xy_sample in pending]
+
+    if workers is None or workers <= 1:
+        values = _collect(pending, map(run_replicate, tasks), store, names)
+
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            values = _collect(pending, executor.map(run_replicate, tasks, chunksize=chunksize), store, names)
+
+    if store is not None:
+        values = [[store.get(rho, sample_size, k, name) for name in names] for rho, sample_size, k, _ in replicates]
+
+    return np.array(values, dtype=float).reshape(len(rhos), len(sample_sizes), K, -1)
+
+
+def _collect(pending, values, store, names):
+    """Consume the values of the pending replicates, recording each in ``store`` as it completes."""
+    collected = []
+    for (rho, sample_size, k, _), value in zip(pending, values):
+        if store is not None:
+            store.record(rho, sample_size, k, dict(zip(names, value)))
+        collected.append(value)
+
+    return collected
+
+
+def summarize(values, rhos, sample_sizes, true_mi=gaussian_mi):
+    """Means and standard deviations over replicates, in the layout of ``table_gen``.
+
+    Both are dicts ``{rho: [{sample_size: [one value per method]}, true_mi(rho)]}``,
+    as expected by ``generate_table`` and ``generate_rs_table``.
+    """
+    means, stds = np.mean(values, axis=2), np.std(values, axis=2)
+
+    results = {rho: [{ssize: list(means[i, j]) for j, ssize in enumerate(sample_sizes)}, true_mi(rho)]
+               for i, rho in enumerate(rhos)}
+    results_std = {rho: [{ssize: list(stds[i, j]) for j, ssize in enumerate(sample_sizes)}, true_mi(rho)]
+                   for i, rho in enumerate(rhos)}
+
+    return results, results_std
+
+
+def run_experiment(methods, rhos, sample_sizes, K, seed=0, workers=None, make_dist=bivariate_gaussian,
+                   true_mi=gaussian_mi, store=None, names=None):
+    """Run the replicates of the grid and summarize them, see ``run_replicates`` and ``summarize``."""
+    values = run_replicates(methods, rhos, sample_sizes, K, seed=seed, workers=workers, make_dist=make_dist,
+                            store=store, names=names)
+    return summarize(values, rhos, sample_sizes, true_mi=true_mi)
@@ -0,0 +1,117 @@
+import numpy as np
+
+from divergence_utils import kl_estimate_arrays
+from partition import BatchedAdaptiveAlgorithm, GridPartition, Partition, Plane
+
+
+class PointLocator:
+    """Vectorized location of points in the cells of a partition.
+
+    The distinct x limits of the cells cut the plane into vertical slabs,
+    and within a slab the cells crossing it tile y. Every (slab, cell)
+    incidence is stored as the key ``slab * len(ys) + rank(ylo)`` in one
+    sorted array, so a point is located with three ``searchsorted`` calls:
+    its slab, the rank of its y and the last cell of the slab starting
+    below it. Memory is the number of incidences, at most cells x slabs and
+    close to the number of cells for adaptive partitions. A ``GridPartition``
+    is located directly from its edges.
+    """
+
+    def __init__(self, partition):
+        self.partition = partition
+
+        if isinstance(partition, GridPartition):
+            return
+
+        # Empty cells contain no point and would shadow the cells they touch
+        valid = np.flatnonzero((partition.xlo < partition.xhi) & (partition.ylo < partition.yhi))
+        self.xs = np.unique(np.concatenate([partition.xlo[valid], partition.xhi[valid]]))
+        self.ys = np.unique(np.concatenate([partition.ylo[valid], partition.yhi[valid]]))
+
+        first = np.searchsorted(self.xs, partition.xlo[valid])
+        n_slabs = np.searchsorted(self.xs, partition.xhi[valid]) - first
+        cells = np.repeat(valid, n_slabs)
+        starts = np.cumsum(n_slabs) - n_slabs
+        slabs = np.repeat(first, n_slabs) + np.arange(len(cells)) - np.repeat(starts, n_slabs)
+
+        keys = slabs * len(self.ys) + np.searchsorted(self.ys, partition.ylo[cells])
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.cells = cells[order]
+
+    def __call__(self, points):
+        """Cell of every point, -1 for the points outside the partition."""
+        points = np.asarray(points, dtype=np.float64)
+        x, y = points[:, 0], points[:, 1]
+        p = self.partition
+
+        if isinstance(p, GridPartition):
+            ix = np.searchsorted(p.xedges, x, side='right') - 1
+            iy = np.searchsorted(p.yedges, y, side='right') - 1
+            inside = (ix >= 0) & (ix < len(p.xedges) - 1) & (iy >= 0) & (iy < len(p.yedges) - 1)
+            return np.where(inside, ix * (len(p.yedges) - 1) + iy, -1)
+
+        slab = np.searchsorted(self.xs, x, side='right') - 1
+        yrank = np.searchsorted(self.ys, y, side='right') - 1
+        idx = np.searchsorted(self.keys, slab * len(self.ys) + yrank, side='right') - 1
+        cell = self.cells[np.clip(idx, 0, len(self.cells) - 1)] if len(self.cells) else np.zeros(len(x), dtype=np.intp)
+
+        inside = ((idx >= 0) & (x >= p.xlo[cell]) & (x < p.xhi[cell]) & (y >= p.ylo[cell]) & (y < p.yhi[cell]))
+        return np.where(inside, cell, -1)
+
+
+class FittedPartition:
+    """A partition fitted once and applied to new batches of points.
+
+    The partition is saved to and loaded from a ``.npz`` file of its cell
+    limits and counts (``Partition.save``), and new points are located in
+    its cells with a ``PointLocator``, built once, so scoring a batch costs
+    a few ``searchsorted`` calls over the batch instead of a refit.
+    """
+
+    def __init__(self, partition):
+        self.partition = partition
+        self.locator = PointLocator(partition)
+
+    @classmethod
+    def fit(cls, sample, delta, r, s, engine=BatchedAdaptiveAlgorithm):
+        """Adaptive partition of ``sample``."""
+        plane = Plane(sample)
+        return cls(engine(sample, delta, r, s, plane=plane).run())
+
+    def save(self, file):
+        self.partition.save(file)
+
+    @classmethod
+    def load(cls, file):
+        return cls(Partition.load(file))
+
+    def assign(self, points):
+        """Cell of every point, -1 for the points outside the partition."""
+        return self.locator(points)
+
+    def counts(self, points):
+        """Number of the points in every cell."""
+        cell = self.assign(points)
+        return np.bincount(cell[cell >= 0], minlength=len(self.partition))
+
+    def density(self, points):
+        """Density estimate at every point, the fitted probability of its cell over its area (0 outside)."""
+        p = self.partition
+        cell = self.assign(points)
+
+        area = (p.xhi - p.xlo) * (p.yhi - p.ylo)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cell_density = np.where(area > 0, p.counts / (p.counts.sum() * area), 0.)
+
+        return np.where(cell >= 0, cell_density[np.maximum(cell, 0)], 0.)
+
+    def mi(self, points, log_base=np.exp(1)):
+        """Plug-in MI estimate of the points inside the partition, on the fitted cells."""
+        points = np.asarray(points, dtype=np.float64)
+        cell = self.assign(points)
+        inside = points[cell >= 0]
+        joint_n = np.bincount(cell[cell >= 0], minlength=len(self.partition))
+
+        p = self.partition
+        return kl_estimate_arrays(Plane(inside), p.xlo, p.xhi, p.ylo, p.yhi, joint_n, log_base=log_base)
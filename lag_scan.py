@@ -0,0 +1,118 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from divergence_utils import kl_estimate
+from mi_matrix import attach_arrays, shared_arrays
+from partition import BatchedAdaptiveAlgorithm, Plane, tabulate_delta
+
+
+class SeriesRanks:
+    """Sort order and ranks of a series, computed once for all its windows.
+
+    ``order`` sorts the series and ``ranks`` is the rank of every value
+    (the number of values strictly below it). The sorted values and ranks
+    of any contiguous window of the series are derived from them in
+    linear time, without sorting again, see ``window``.
+    """
+
+    def __init__(self, values, order=None, ranks=None):
+        self.values = values
+
+        if order is None:
+            order = np.argsort(values, kind='stable')
+            ranks = np.searchsorted(values[order], values, side='left')
+
+        self.order = order
+        self.ranks = ranks
+
+    @classmethod
+    def from_series(cls, values):
+        return cls(np.ascontiguousarray(values, dtype=np.float64))
+
+    def window(self, start, stop):
+        """Sorted values and ranks of ``values[start:stop]``."""
+        position = self.order[(self.order >= start) & (self.order < stop)]
+        # Values of the window below every rank of the whole series
+        inside = np.zeros(len(self.values), dtype=bool)
+        inside[start:stop] = True
+        below = np.concatenate(([0], np.cumsum(inside[self.order])))
+
+        return self.values[position], below[self.ranks[start:stop]]
+
+
+def lag_windows(n, lag):
+    """Slices of ``x`` and ``y`` pairing ``x[t]`` with ``y[t + lag]``."""
+    if lag >= 0:
+        return slice(0, n - lag), slice(lag, n)
+
+    return slice(-lag, n), slice(0, n + lag)
+
+
+class LagEstimator:
+    """Adaptive partition MI estimate of ``(x[t], y[t + lag])`` for a lag."""
+
+    def __init__(self, x, y, delta, r, s, log_base):
+        self.x = x
+        self.y = y
+        self.delta = delta
+        self.r = r
+        self.s = s
+        self.log_base = log_base
+
+    def __call__(self, lag):
+        xwin, ywin = lag_windows(len(self.x.values), lag)
+        sample = np.column_stack((self.x.values[xwin], self.y.values[ywin]))
+        x_sorted, x_ranks = self.x.window(xwin.start, xwin.stop)
+        y_sorted, y_ranks = self.y.window(ywin.start, ywin.stop)
+
+        # Shared only when every sample is inside the plane, see ColumnMarginals
+        if x_sorted[-1] + 1e-6 > x_sorted[-1] and y_sorted[-1] + 1e-6 > y_sorted[-1]:
+            plane = Plane(sample, sorted_marginals=(x_sorted, y_sorted), ranks=(x_ranks, y_ranks))
+
+        else:
+            plane = Plane(sample)
+
+        partition = BatchedAdaptiveAlgorithm(sample, self.delta, self.r, self.s, plane=plane).run()
+        return kl_estimate(plane, partition, log_base=self.log_base)
+
+
+_estimator = None
+
+
+def _attach_worker(blocks, delta, r, s, log_base):
+    """Process pool initializer, maps the shared series of the parent."""
+    global _estimator
+    x, x_order, x_ranks, y, y_order, y_ranks = attach_arrays(blocks)
+    _estimator = LagEstimator(SeriesRanks(x, x_order, x_ranks), SeriesRanks(y, y_order, y_ranks), delta, r, s,
+                              log_base)
+
+
+def _worker_estimate(lag):
+    return _estimator(lag)
+
+
+def lag_scan(x, y, lags, delta, r=2, s=2, log_base=np.exp(1), workers=None, chunksize=4):
+    """Adaptive partition MI estimates of ``(x[t], y[t + lag])`` for every lag of ``lags``.
+
+    Each series is sorted and ranked once; the sorted marginals and ranks
+    of every lagged pair are derived from them (see ``SeriesRanks.window``)
+    and given to its plane, so no lag sorts its marginals again. With
+    ``workers`` the lags are spread over a process pool that maps the
+    series, their orders and ranks from shared memory. Returns an array of
+    one estimate per lag.
+    """
+    x, y = SeriesRanks.from_series(x), SeriesRanks.from_series(y)
+    if len(x.values) != len(y.values):
+        raise ValueError("x and y must have the same length")
+
+    lags = [int(lag) for lag in lags]
+    delta = tabulate_delta(delta, s)
+
+    if workers is None or workers <= 1:
+        return np.array(list(map(LagEstimator(x, y, delta, r, s, log_base), lags)))
+
+    with shared_arrays([x.values, x.order, x.ranks, y.values, y.order, y.ranks]) as blocks:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker,
+                                 initargs=(blocks, delta, r, s, log_base)) as executor:
+            return np.array(list(executor.map(_worker_estimate, lags, chunksize=chunksize)))
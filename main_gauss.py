@@ -1,12 +1,12 @@
+import os
 
 import numpy as np
 from matplotlib import pyplot as plt
-from scipy.stats.stats import pearsonr   
 from scipy.stats import chi2
 
-from distributions import MultivariateNormal
-from divergence_utils import kl_estimate
-from partition import AdaptiveAlgorithm, NonAdaptivePartition, Plane
+from cache import PartitionCache
+from experiments import AdaptiveEstimator, MLEstimator, NonAdaptiveEstimator, run_experiment
+from store import ResultStore
 from table_gen import generate_table
 
 
@@ -18,58 +18,27 @@ def main():
     s = 2
     K = 50
 
-    ci_mi_all_std = []
-    na_mi_all_std = []
-    ml_mi_all_std = []
+    delta = lambda x: chi2.ppf(0.97, x ** 2 - 1)
 
-    results = {rho: [{ssize: [] for ssize in sample_sizes}, None] for rho in rhos}
+    # Reruns with MI_CACHE set reuse the partitions and estimates of earlier runs
+    cache = PartitionCache(os.environ["MI_CACHE"]) if "MI_CACHE" in os.environ else None
 
-    for rho in rhos:
-
-        ci_mi_std = []
-        na_mi_std = []
-        ml_mi_std = []
-
-        real_mi = - np.log(1 - rho ** 2) / 2
-
-        results[rho][1] = real_mi
+    methods = [MLEstimator(), AdaptiveEstimator(delta, r, s, cache=cache), NonAdaptiveEstimator(bins=[50, 50], cache=cache)]
+    # Replicates are recorded as they complete, a rerun only computes the missing ones
+    store = ResultStore(os.environ.get("MI_STORE", "results_gauss.jsonl"))
+    results, results_std = run_experiment(methods, rhos, sample_sizes, K, workers=os.cpu_count(),
+                                          store=store, names=["ML", "CI", "NA"])
 
+    for rho in rhos:
         for sample_size in sample_sizes:
-
-            cov = np.array([[1., rho], [rho, 1.]])
-            dist = MultivariateNormal(mean=np.zeros(2), cov=cov)
-
-            ci_mi_l, ml_mi_l, na_mi_l = [], [], []
-
-            delta = lambda x: chi2.ppf(0.97, x ** 2 - 1)
-
-            for k in range(K):
-                
-                xy_sample = dist.sample(sample_size)
-
-                plane = Plane(xy_sample)
-
-                # Adaptive algorithm
-                ci_mi_l.append(kl_estimate(plane, AdaptiveAlgorithm(xy_sample, delta, r, s).run()))
-
-                na_mi_l.append(kl_estimate(plane, NonAdaptivePartition(xy_sample, bins=[50, 50]).run()))
-
-                ml_mi_l.append(- np.log(1 - pearsonr(xy_sample[:, 0], xy_sample[:, 1])[0] ** 2) / 2)
-
-            results[rho][0][sample_size] = [np.mean(ml_mi_l), np.mean(ci_mi_l), np.mean(na_mi_l)]
+            ml_mi, ci_mi, na_mi = results[rho][0][sample_size]
 
             print("---------------------------------------------------------------------------------------------")
-            print("rho: %.2f, Sample Size: %d, Real MI: %.4f" % (rho, sample_size, real_mi))
-            print("Adaptive Partition MI: %.4f, NA Partition MI: %.4f, ML MI: %.4f" % 
-                  (np.mean(ci_mi_l), np.mean(na_mi_l), np.mean(ml_mi_l)))
-
-            ci_mi_std.append(np.std(ci_mi_l))
-            na_mi_std.append(np.std(na_mi_l))
-            ml_mi_std.append(np.std(ml_mi_l))
+            print("rho: %.2f, Sample Size: %d, Real MI: %.4f" % (rho, sample_size, results[rho][1]))
+            print("Adaptive Partition MI: %.4f, NA Partition MI: %.4f, ML MI: %.4f" % (ci_mi, na_mi, ml_mi))
 
-        ci_mi_all_std.append(ci_mi_std)
-        na_mi_all_std.append(na_mi_std)
-        ml_mi_all_std.append(ml_mi_std)
+    ml_mi_all_std, ci_mi_all_std, na_mi_all_std = [[[results_std[rho][0][ssize][i] for ssize in sample_sizes]
+                                                    for rho in rhos] for i in range(3)]
 
     generate_table(results)
 
@@ -1,11 +1,12 @@
+import os
 
 import numpy as np
 from matplotlib import pyplot as plt
 from scipy.stats import chi2
 
-from distributions import MultivariateNormal
-from divergence_utils import kl_estimate
-from partition import AdaptiveAlgorithm, Plane
+from experiments import run_experiment
+from sweep import ConfigurationSweep
+from store import ResultStore
 from table_gen import generate_rs_table
 
 
@@ -15,65 +16,23 @@ def main():
     rhos = [0, 0.3, 0.6, 0.9]
     K = 20
 
-    rs_2 = []
-    rs_4 = []
-    rs_5 = []
-    rs_10 = []
+    delta = lambda x: chi2.ppf(0.97, x ** 2 - 1)
 
-    results = {rho: [{ssize: [] for ssize in sample_sizes}, None] for rho in rhos}
+    # All (r, s) settings share the work done on each replicate sample
+    methods = [ConfigurationSweep([(rs, rs, delta) for rs in [2, 4, 5, 10]])]
+    # Replicates are recorded as they complete, a rerun only computes the missing ones
+    store = ResultStore(os.environ.get("MI_STORE", "results_rs.jsonl"))
+    results, results_std = run_experiment(methods, rhos, sample_sizes, K, workers=os.cpu_count(),
+                                          store=store, names=["r=s=2", "r=s=4", "r=s=5", "r=s=10"])
 
     for rho in rhos:
-
-        rs_2_std = []
-        rs_4_std = []
-        rs_5_std = []
-        rs_10_std = []
-
-        real_mi = - np.log(1 - rho ** 2) / 2
-
-        results[rho][1] = real_mi
-
         for sample_size in sample_sizes:
-
-            cov = np.array([[1., rho], [rho, 1.]])
-            dist = MultivariateNormal(mean=np.zeros(2), cov=cov)
-
-            rs_2_l, rs_4_l, rs_5_l, rs_10_l = [], [], [], []
-
-            delta = lambda x: chi2.ppf(0.97, x ** 2 - 1)
-
-            for k in range(K):
-                
-                xy_sample = dist.sample(sample_size)
-
-
-                # Adaptive algorithm
-                plane = Plane(xy_sample)
-                rs_2_l.append(kl_estimate(plane, AdaptiveAlgorithm(xy_sample, delta, 2, 2).run()))
-                plane = Plane(xy_sample)
-                rs_4_l.append(kl_estimate(plane, AdaptiveAlgorithm(xy_sample, delta, 4, 4).run()))
-                plane = Plane(xy_sample)
-                rs_5_l.append(kl_estimate(plane, AdaptiveAlgorithm(xy_sample, delta, 5, 5).run()))
-                plane = Plane(xy_sample)
-                rs_10_l.append(kl_estimate(plane, AdaptiveAlgorithm(xy_sample, delta, 10, 10).run()))
-
-
-            results[rho][0][sample_size] = [np.mean(rs_2_l), np.mean(rs_4_l), np.mean(rs_5_l), np.mean(rs_10_l)]
-
             print("---------------------------------------------------------------------------------------------")
-            print("rho: %.2f, Sample Size: %d, Real MI: %.4f" % (rho, sample_size, real_mi))
-            print("r=s=2: %.4f, r=s=4: %.4f, r=s=5: %.4f, r=s=10: %.4f" % 
-                  (np.mean(rs_2_l), np.mean(rs_4_l), np.mean(rs_5_l), np.mean(rs_5_l)))
-
-            rs_2_std.append(np.std(rs_2_l))
-            rs_4_std.append(np.std(rs_4_l))
-            rs_5_std.append(np.std(rs_5_l))
-            rs_10_std.append(np.std(rs_5_l))
-
-        rs_2.append(rs_2_std)
-        rs_4.append(rs_4_std)
-        rs_5.append(rs_5_std)
-        rs_10.append(rs_10_std)
+            print("rho: %.2f, Sample Size: %d, Real MI: %.4f" % (rho, sample_size, results[rho][1]))
+            print("r=s=2: %.4f, r=s=4: %.4f, r=s=5: %.4f, r=s=10: %.4f" % tuple(results[rho][0][sample_size]))
+
+    rs_2, rs_4, rs_5, rs_10 = [[[results_std[rho][0][ssize][i] for ssize in sample_sizes] for rho in rhos]
+                               for i in range(4)]
 
     generate_rs_table(results)
 
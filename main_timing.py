@@ -1,13 +1,15 @@
+import os
 import time
 
 import numpy as np
 from matplotlib import pyplot as plt
-from scipy.stats.stats import pearsonr   
+from scipy.stats import pearsonr
 from scipy.stats import chi2
 
 from distributions import MultivariateNormal
 from divergence_utils import kl_estimate
 from partition import AdaptiveAlgorithm, NonAdaptivePartition, Plane
+from store import ResultStore
 from table_gen import generate_timing_table
 
 
@@ -19,8 +21,9 @@ def main():
     s = 2
     K = 50
 
-    time_results = {rho: [{ssize: [] for ssize in sample_sizes}, None] for rho in rhos}
-    all_results = []
+    names = ["ML", "CI", "NA"]
+    # Times are recorded as replicates complete, a rerun only times the missing ones
+    store = ResultStore(os.environ.get("MI_STORE", "results_timing.jsonl"))
 
     for rho in rhos:
         for sample_size in sample_sizes:
@@ -28,39 +31,43 @@ def main():
             cov = np.array([[1., rho], [rho, 1.]])
             dist = MultivariateNormal(mean=np.zeros(2), cov=cov)
 
-            t_ci, t_nad, t_ml = [], [], []
+            pending = [k for k in range(K) if not store.done(rho, sample_size, k, names)]
 
             delta = lambda x: chi2.ppf(0.97, x ** 2 - 1)
 
             print(f"Timing samples {sample_size} for r = {rho}")
 
-            for k in range(K):
+            # Warmup, so the first replicate doesn't pay for imports and caches
+            if pending:
+                warmup_sample = dist.sample(sample_size)
+                AdaptiveAlgorithm(warmup_sample, delta, r, s).run()
+                NonAdaptivePartition(warmup_sample, bins=[50, 50]).run()
+
+            for k in pending:
                 xy_sample = dist.sample(sample_size)
 
                 plane = Plane(xy_sample)
 
                 # Adaptive algorithm
-                t0_ad = time.time()
+                t0_ad = time.perf_counter()
                 ad = AdaptiveAlgorithm(xy_sample, delta, r, s).run()
-                t_ci.append(time.time() - t0_ad)
+                t_ci = time.perf_counter() - t0_ad
 
-                t0_nad = time.time()
+                t0_nad = time.perf_counter()
                 nad = NonAdaptivePartition(xy_sample, bins=[50, 50]).run()
-                t_nad.append(time.time() - t0_nad)
+                t_nad = time.perf_counter() - t0_nad
 
-                t0_ml = time.time()
+                t0_ml = time.perf_counter()
                 ml = - np.log(1 - pearsonr(xy_sample[:, 0], xy_sample[:, 1])[0] ** 2) / 2
-                t_ml.append(time.time() - t0_ml)
-
-                all_results.append((ad, nad, ml))
+                t_ml = time.perf_counter() - t0_ml
 
-            time_results[rho][0][sample_size] = [np.mean(t_ml), np.mean(t_ci), np.mean(t_nad)]
+                store.record(rho, sample_size, k, {"ML": t_ml, "CI": t_ci, "NA": t_nad})
 
-            print(f"Times: ML: {np.mean(t_ml)}, CI: {np.mean(t_ci)}, NAD: {np.mean(t_nad)}")
+            t_ml, t_ci, t_nad = np.mean([[store.get(rho, sample_size, k, name) for name in names] for k in range(K)], axis=0)
 
-    generate_timing_table(time_results)
+            print(f"Times: ML: {t_ml}, CI: {t_ci}, NAD: {t_nad}")
 
-    print(len(all_results))
+    generate_timing_table(store.summarize(names, rhos, sample_sizes)[0])
 
 
 if __name__ == "__main__":
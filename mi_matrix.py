@@ -0,0 +1,141 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import combinations
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from divergence_utils import kl_estimate
+from partition import BatchedAdaptiveAlgorithm, Plane, tabulate_delta
+
+
+class ColumnMarginals:
+    """Per-column work of an (N, d) table, done once for all pairs of columns.
+
+    ``columns[i]`` is column ``i`` as a contiguous array, ``sorted[i]`` its
+    sorted values and ``ranks[i]`` the rank of every value. ``shareable[i]``
+    tells whether every sample is inside the plane along that column (the
+    plane upper limit ``max + 1e-6`` can round to ``max`` for huge values),
+    only then can its sorted values and ranks be given to a pair's plane.
+    """
+
+    def __init__(self, columns, sorted_columns=None, ranks=None):
+        self.columns = columns
+
+        if sorted_columns is None:
+            sorted_columns = np.sort(columns, axis=1)
+            ranks = np.array([np.searchsorted(marg, col, side='left') for marg, col in zip(sorted_columns, columns)])
+
+        self.sorted = sorted_columns
+        self.ranks = ranks
+
+        col_max = self.sorted[:, -1]
+        self.shareable = col_max + 1e-6 > col_max
+
+    @classmethod
+    def from_table(cls, data):
+        return cls(np.ascontiguousarray(np.asarray(data, dtype=np.float64).T))
+
+    def plane(self, i, j):
+        sample = np.column_stack((self.columns[i], self.columns[j]))
+
+        if self.shareable[i] and self.shareable[j]:
+            return Plane(sample, sorted_marginals=(self.sorted[i], self.sorted[j]), ranks=(self.ranks[i], self.ranks[j]))
+
+        return Plane(sample)
+
+
+class PairEstimator:
+    """Adaptive partition MI estimate of a pair of columns."""
+
+    def __init__(self, marginals, delta, r, s, log_base):
+        self.marginals = marginals
+        self.delta = delta
+        self.r = r
+        self.s = s
+        self.log_base = log_base
+
+    def __call__(self, pair):
+        plane = self.marginals.plane(*pair)
+        partition = BatchedAdaptiveAlgorithm(plane.sample, self.delta, self.r, self.s, plane=plane).run()
+        return kl_estimate(plane, partition, log_base=self.log_base)
+
+
+_estimator = None
+_shared_blocks = []
+
+
+@contextmanager
+def shared_arrays(arrays):
+    """Copy ``arrays`` to shared memory for the lifetime of the context.
+
+    Yields the ``(name, shape, dtype)`` block of every array, from which
+    worker processes map them with ``attach_arrays``.
+    """
+    shms, blocks = [], []
+    try:
+        for array in arrays:
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shms.append(shm)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+            blocks.append((shm.name, array.shape, array.dtype))
+
+        yield blocks
+
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+
+def attach_arrays(blocks):
+    """Map the arrays of ``shared_arrays`` blocks, they stay mapped for the life of the process."""
+    arrays = []
+    for name, shape, dtype in blocks:
+        shm = shared_memory.SharedMemory(name=name)
+        _shared_blocks.append(shm)
+        arrays.append(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+    return arrays
+
+
+def _attach_worker(blocks, delta, r, s, log_base):
+    """Process pool initializer, maps the shared arrays of the parent."""
+    global _estimator
+    _estimator = PairEstimator(ColumnMarginals(*attach_arrays(blocks)), delta, r, s, log_base)
+
+
+def _worker_estimate(pair):
+    return _estimator(pair)
+
+
+def mi_matrix(data, delta, r=2, s=2, log_base=np.exp(1), workers=None, chunksize=16):
+    """Matrix of adaptive partition MI estimates between all columns of ``data``.
+
+    Sorting and ranking of the ``d`` columns is done once and shared by the
+    ``d * (d - 1) / 2`` pairs, each estimated with ``BatchedAdaptiveAlgorithm``.
+    With ``workers`` the pairs are spread over a process pool; the columns,
+    sorted columns and ranks are placed in shared memory so workers map them
+    instead of receiving a pickled copy. The diagonal is NaN.
+    """
+    marginals = ColumnMarginals.from_table(data)
+    d = marginals.columns.shape[0]
+    pairs = list(combinations(range(d), 2))
+    delta = tabulate_delta(delta, s)
+
+    if workers is None or workers <= 1:
+        estimates = map(PairEstimator(marginals, delta, r, s, log_base), pairs)
+        return _fill_matrix(d, pairs, estimates)
+
+    with shared_arrays([marginals.columns, marginals.sorted, marginals.ranks]) as blocks:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker,
+                                 initargs=(blocks, delta, r, s, log_base)) as executor:
+            return _fill_matrix(d, pairs, executor.map(_worker_estimate, pairs, chunksize=chunksize))
+
+
+def _fill_matrix(d, pairs, estimates):
+    matrix = np.full((d, d), np.nan)
+    for (i, j), estimate in zip(pairs, estimates):
+        matrix[i, j] = matrix[j, i] = estimate
+
+    return matrix
@@ -0,0 +1,346 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from partition import Partition
+from sketch import KLLSketch, StripSketches
+from streaming import SortedRuns
+
+
+def open_sample(sample):
+    """An (N, 2) sample given as a ``.npy`` path is memory mapped, arrays are used as they are."""
+    if isinstance(sample, (str, os.PathLike)):
+        return np.load(sample, mmap_mode='r')
+
+    return sample
+
+
+def linear_quantiles(marginal, quantiles):
+    """``np.quantile`` of the values of a ``SortedRuns``, from two order statistics per quantile."""
+    n = len(marginal)
+    virtual = (n - 1) * np.asarray(quantiles)
+    previous = np.floor(virtual).astype(np.intp)
+    gamma = virtual - previous
+    below = marginal.select(previous)
+    above = marginal.select(np.minimum(previous + 1, n - 1))
+
+    # Same interpolation as NumPy, so results are bit-identical
+    diff = above - below
+    return np.where(gamma >= 0.5, above - diff * (1 - gamma), below + diff * gamma)
+
+
+class DiskRuns(SortedRuns):
+    """Sorted runs of a marginal too large for memory, saved as ``.npy`` files and memory mapped.
+
+    Every inserted chunk is sorted and saved as a run of its own, runs are
+    never merged: ranks and order statistics read O(log N) pages of each.
+    """
+
+    def __init__(self, directory, name):
+        super().__init__()
+        self.directory = directory
+        self.name = name
+
+    def insert(self, values):
+        path = os.path.join(self.directory, f"{self.name}_{len(self.runs)}.npy")
+        np.save(path, np.sort(np.asarray(values, dtype=np.float64)))
+        self.runs.append(np.load(path, mmap_mode='r'))
+
+
+class OutOfCoreAdaptiveAlgorithm:
+    """Adaptive partition of a sample that does not fit in memory.
+
+    ``sample`` is an (N, 2) array, typically a ``np.memmap``, or the path
+    of a ``.npy`` file, which is memory mapped. The partition is the one of
+    ``BatchedAdaptiveAlgorithm``, built with a bounded amount of memory:
+
+    * the sample is read in chunks of at most ``memory_budget`` bytes of
+      working memory;
+    * the marginals are sorted chunk by chunk into ``DiskRuns`` in a
+      temporary directory (``tmpdir``), from which the quantiles of the
+      strips are read;
+    * the node every sample is in is kept in a memory-mapped file, and
+      every refinement level makes one pass over the sample, descending
+      each sample one level and counting the samples of every frontier
+      rectangle on its ``s ** 2`` and ``r`` grids. Count tables larger than
+      the budget are filled in several passes over groups of rectangles.
+
+    Only the tree of splits, whose size grows with the number of cells,
+    is held in memory.
+
+    With ``quantile_error`` nothing is written to disk: split points are
+    approximate quantiles with ranks within ``quantile_error`` times the
+    strip size. The initial partition comes from ``KLLSketch`` of the whole
+    marginals, and as split points only depend on the strip of a rectangle,
+    the strips its children may have are sketched (``StripSketches``)
+    during the pass of its level, for the next one. Strips smaller than the
+    sketches are summarized exactly, and cell and marginal counts stay
+    exact; see ``approximation_report`` for the effect on the estimate.
+    """
+
+    def __init__(self, sample, delta, r, s, memory_budget=2 ** 28, tmpdir=None, quantile_error=None, seed=None):
+        self.sample = open_sample(sample)
+        self.delta = delta
+        self.r = r
+        self.s = s
+        self.memory_budget = memory_budget
+        self.tmpdir = tmpdir
+        self.quantile_error = quantile_error
+        self.seed = seed
+
+        # Sample coordinates, node ids and the s ** 2 grid comparisons of a chunk
+        self.chunk_size = max(memory_budget // (32 + 16 * s ** 2), 1)
+        self.n_passes = 0
+        self.rfinal = None
+
+    def chunks(self):
+        for start in range(0, len(self.sample), self.chunk_size):
+            yield start, np.asarray(self.sample[start:start + self.chunk_size], dtype=np.float64)
+
+        self.n_passes += 1
+
+    def plane_limits(self):
+        """Limits of the plane, as ``Plane`` sets them, in one pass."""
+        low, high = np.full(2, np.inf), np.full(2, -np.inf)
+        for _, chunk in self.chunks():
+            low = np.minimum(low, chunk.min(axis=0))
+            high = np.maximum(high, chunk.max(axis=0))
+
+        high = high + 1e-6
+        return [low[0], high[0]], [low[1], high[1]]
+
+    def grid_tables(self, nodes, ids, frontier, grids, descend, strips=()):
+        """Counts of the samples of ``frontier`` rectangles on their grids, in one pass.
+
+        ``grids`` maps a grid size to its ``(xsplits, ysplits)`` for the
+        frontier rectangles. With ``descend`` the samples in a node split at
+        the previous level are first moved down to their child. The samples
+        are also added to the x and y ``StripSketches`` of ``strips``.
+        """
+        xsplits_all, ysplits_all, child = nodes
+        lookup = np.full(len(child), -1)
+        lookup[frontier] = np.arange(len(frontier))
+        tables = {val: np.zeros(len(frontier) * val ** 2, dtype=np.int64) for val in grids}
+
+        for start, chunk in self.chunks():
+            node = np.asarray(ids[start:start + len(chunk)])
+
+            if descend:
+                moved = np.flatnonzero(node >= 0)
+                moved = moved[child[node[moved]] >= 0]
+                parent = node[moved]
+                xbin = np.sum(xsplits_all[parent] <= chunk[moved, 0, None], axis=1)
+                ybin = np.sum(ysplits_all[parent] <= chunk[moved, 1, None], axis=1)
+                node[moved] = child[parent] + xbin * self.r + ybin
+                ids[start:start + len(chunk)] = node
+
+            if strips:
+                strips[0].add(chunk[node >= 0, 0])
+                strips[1].add(chunk[node >= 0, 1])
+
+            cell = lookup[np.maximum(node, 0)]
+            selected = np.flatnonzero((node >= 0) & (cell >= 0))
+            cell, points = cell[selected], chunk[selected]
+            for val, (xsplits, ysplits) in grids.items():
+                xbin = np.sum(xsplits[cell] <= points[:, 0, None], axis=1)
+                ybin = np.sum(ysplits[cell] <= points[:, 1, None], axis=1)
+                tables[val] += np.bincount(cell * val ** 2 + xbin * val + ybin, minlength=len(tables[val]))
+
+        return {val: table.reshape(len(frontier), val ** 2) for val, table in tables.items()}
+
+    def sketch_strips(self, ids, xstrips, ystrips):
+        """Sketches of the strips set in ``StripSketches``, in one pass."""
+        for start, chunk in self.chunks():
+            inside = np.asarray(ids[start:start + len(chunk)]) >= 0
+            xstrips.add(chunk[inside, 0])
+            ystrips.add(chunk[inside, 1])
+
+        xstrips.finish()
+        ystrips.finish()
+
+    def run(self):
+        xlim, ylim = self.plane_limits()
+        finest = self.s ** 2
+        n_children = self.r ** 2
+        thresholds = {val: self.delta(val) for val in [self.s, finest]}
+
+        sketched = self.quantile_error is not None
+
+        with tempfile.TemporaryDirectory(dir=self.tmpdir) as directory:
+            if not sketched:
+                xmarg, ymarg = DiskRuns(directory, "x"), DiskRuns(directory, "y")
+                xall, yall = xmarg, ymarg
+
+            else:
+                seeds = np.random.SeedSequence(self.seed).spawn(4)
+                xall, yall = KLLSketch(self.quantile_error, seeds[0]), KLLSketch(self.quantile_error, seeds[1])
+                xmarg = StripSketches(self.quantile_error, seeds[2])
+                ymarg = StripSketches(self.quantile_error, seeds[3])
+
+            ids = np.lib.format.open_memmap(os.path.join(directory, "ids.npy"), mode='w+', dtype=np.int64,
+                                            shape=(len(self.sample),))
+
+            # Samples outside the plane (its upper limit can round to the maximum) are left out
+            for start, chunk in self.chunks():
+                inside = ((chunk[:, 0] >= xlim[0]) & (chunk[:, 0] < xlim[1]) &
+                          (chunk[:, 1] >= ylim[0]) & (chunk[:, 1] < ylim[1]))
+                ids[start:start + len(chunk)] = np.where(inside, 0, -1)
+                xall.insert(chunk[inside, 0])
+                yall.insert(chunk[inside, 1])
+
+            # Tree of splits: node 0 is the plane, split by the equiprobable partition
+            quantiles = np.arange(1, self.r) / self.r
+            xpartition = np.array([xlim[0], *linear_quantiles(xall, quantiles), xlim[1]])
+            ypartition = np.array([ylim[0], *linear_quantiles(yall, quantiles), ylim[1]])
+            ix, iy = np.divmod(np.arange(n_children), self.r)
+
+            xlo = np.concatenate(([xlim[0]], xpartition[ix]))
+            xhi = np.concatenate(([xlim[1]], xpartition[ix + 1]))
+            ylo = np.concatenate(([ylim[0]], ypartition[iy]))
+            yhi = np.concatenate(([ylim[1]], ypartition[iy + 1]))
+            child = np.concatenate(([1], np.full(n_children, -1)))
+            xsplits = np.concatenate((xpartition[None, 1:-1], np.zeros((n_children, self.r - 1))))
+            ysplits = np.concatenate((ypartition[None, 1:-1], np.zeros((n_children, self.r - 1))))
+            counts = np.zeros(1 + n_children, dtype=np.int64)
+
+            frontier = np.arange(1, 1 + n_children)
+            if sketched:
+                xmarg.reset([xlim[0]], [xlim[1]], xpartition[None, 1:-1])
+                ymarg.reset([ylim[0]], [ylim[1]], ypartition[None, 1:-1])
+                self.sketch_strips(ids, xmarg, ymarg)
+
+            final = []
+            descend = True
+            while len(frontier) > 0:
+                if sketched:
+                    # The strips of the children are sketched in the first pass of the level
+                    level_grid = (xmarg.strip_quantiles(xlo[frontier], xhi[frontier], self.r),
+                                  ymarg.strip_quantiles(ylo[frontier], yhi[frontier], self.r))
+                    xmarg.reset(xlo[frontier], xhi[frontier], level_grid[0])
+                    ymarg.reset(ylo[frontier], yhi[frontier], level_grid[1])
+
+                # Count tables of a group of rectangles must fit in the budget
+                table_size = 8 * (finest ** 2 + (0 if finest % self.r == 0 else n_children))
+                group_size = max(self.memory_budget // (2 * table_size), 1)
+
+                split = np.zeros(len(frontier), dtype=bool)
+                child_tables = []
+                for group_start in range(0, len(frontier), group_size):
+                    group = frontier[group_start:group_start + group_size]
+                    grids = {finest: (xmarg.strip_quantiles(xlo[group], xhi[group], finest),
+                                      ymarg.strip_quantiles(ylo[group], yhi[group], finest))}
+                    if sketched:
+                        grids[self.r] = (level_grid[0][group_start:group_start + len(group)],
+                                         level_grid[1][group_start:group_start + len(group)])
+
+                    elif finest % self.r != 0:
+                        grids[self.r] = (xmarg.strip_quantiles(xlo[group], xhi[group], self.r),
+                                         ymarg.strip_quantiles(ylo[group], yhi[group], self.r))
+
+                    strips = (xmarg, ymarg) if sketched and group_start == 0 else ()
+                    tables = self.grid_tables((xsplits, ysplits, child), ids, group, grids, descend, strips)
+                    descend = False
+
+                    # Coarser grids dividing s ** 2 add up blocks of its table
+                    for val in {self.s, self.r} - set(tables):
+                        k = finest // val
+                        fine = tables[finest].reshape(len(group), val, k, val, k)
+                        tables[val] = fine.sum(axis=(2, 4)).reshape(len(group), val ** 2)
+                        grids[val] = grids[finest][0][:, k - 1::k], grids[finest][1][:, k - 1::k]
+
+                    n_samples = tables[finest].sum(axis=1)
+                    counts[group] = n_samples
+                    group_split = np.zeros(len(group), dtype=bool)
+                    undecided = n_samples > 2
+                    for val in [self.s, finest]:
+                        e_val = n_samples / (val ** 2)
+                        with np.errstate(divide='ignore', invalid='ignore'):
+                            estimate = np.sum(np.square(tables[val] - e_val[:, None]), axis=1) / e_val
+
+                        passed = undecided & (estimate >= thresholds[val])
+                        group_split |= passed
+                        undecided &= ~passed
+
+                    split[group_start:group_start + len(group)] = group_split
+                    child_tables.append((grids[self.r], tables[self.r]))
+
+                # Children of the rectangles that passed a test
+                grid_x = np.concatenate([grid[0] for grid, _ in child_tables])[split]
+                grid_y = np.concatenate([grid[1] for grid, _ in child_tables])[split]
+                child_n = np.concatenate([table for _, table in child_tables])[split].ravel()
+                parents = frontier[split]
+
+                xpart = np.concatenate([xlo[parents, None], grid_x, xhi[parents, None]], axis=1)
+                ypart = np.concatenate([ylo[parents, None], grid_y, yhi[parents, None]], axis=1)
+                first = len(child)
+                new = np.arange(first, first + len(parents) * n_children)
+                child[parents] = new[::n_children]
+                xsplits[parents], ysplits[parents] = grid_x, grid_y
+
+                xlo = np.concatenate((xlo, xpart[:, ix].ravel()))
+                xhi = np.concatenate((xhi, xpart[:, ix + 1].ravel()))
+                ylo = np.concatenate((ylo, ypart[:, iy].ravel()))
+                yhi = np.concatenate((yhi, ypart[:, iy + 1].ravel()))
+                child = np.concatenate((child, np.full(len(new), -1)))
+                xsplits = np.concatenate((xsplits, np.zeros((len(new), self.r - 1))))
+                ysplits = np.concatenate((ysplits, np.zeros((len(new), self.r - 1))))
+                counts = np.concatenate((counts, child_n))
+
+                if sketched:
+                    xmarg.finish()
+                    ymarg.finish()
+
+                final.extend([frontier[~split], new[child_n <= 2]])
+                frontier = new[child_n > 2]
+                descend = True
+
+            leaves = np.sort(np.concatenate(final))
+            self.n_samples = len(xall)
+            if not sketched:
+                self.x_counts = xmarg.rank(xhi[leaves]) - xmarg.rank(xlo[leaves])
+                self.y_counts = ymarg.rank(yhi[leaves]) - ymarg.rank(ylo[leaves])
+
+            else:
+                self.x_counts = xmarg.strip_sizes(xlo[leaves], xhi[leaves])
+                self.y_counts = ymarg.strip_sizes(ylo[leaves], yhi[leaves])
+
+            # Release the memory maps before their files are removed
+            del xmarg, ymarg, xall, yall, ids
+
+        self.rfinal = Partition(xlo[leaves], xhi[leaves], ylo[leaves], yhi[leaves], counts[leaves])
+        return self.rfinal
+
+    def estimate(self, log_base=np.exp(1)):
+        """Plug-in MI estimate of the partition, as ``kl_estimate`` gives it."""
+        joint_n = self.rfinal.counts.astype(float)
+        nonempty = joint_n > 0
+        marg_n = self.x_counts[nonempty].astype(float) * self.y_counts[nonempty]
+
+        mi_estimate = np.sum(joint_n[nonempty] * np.log(self.n_samples * joint_n[nonempty] / marg_n))
+        return mi_estimate / (self.n_samples * np.log(log_base))
+
+
+def approximation_report(sample, delta, r, s, quantile_errors=(0.05, 0.01, 0.001), log_base=np.exp(1), **kwargs):
+    """Deviation of the MI estimate with sketched quantiles from the exact one.
+
+    Returns one dict per error bound with the ``estimate``, its
+    ``deviation`` from the exact estimate, the number of ``cells`` and the
+    run ``time`` in seconds; the exact run comes first, with a
+    ``quantile_error`` of None. Other arguments go to
+    ``OutOfCoreAdaptiveAlgorithm``.
+    """
+    report = []
+    exact = None
+    for quantile_error in [None, *quantile_errors]:
+        algorithm = OutOfCoreAdaptiveAlgorithm(sample, delta, r, s, quantile_error=quantile_error, **kwargs)
+        t0 = time.perf_counter()
+        partition = algorithm.run()
+        elapsed = time.perf_counter() - t0
+        estimate = algorithm.estimate(log_base=log_base)
+        exact = estimate if exact is None else exact
+        report.append({"quantile_error": quantile_error, "estimate": estimate, "deviation": estimate - exact,
+                       "cells": len(partition), "time": elapsed})
+
+    return report
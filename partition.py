@@ -1,10 +1,17 @@
 
 # from __future__ import annotations
+import sys
+import time
 from typing import Union, List
 import numpy as np
 from matplotlib import pyplot as plt
 from matplotlib import collections
 
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
 
 class CustomRect(collections.LineCollection):
     def __init__(self, xlim, ylim, *args, **kwargs):
@@ -19,21 +26,288 @@ class CustomRect(collections.LineCollection):
 
 class SmartRectangle:
 
-    def __init__(self, xlim, ylim, plane):
+    def __init__(self, xlim, ylim, plane, samples_inside=None):
+        if len(xlim) != 2 or len(ylim) != 2:
+            raise ValueError("xlim or ylim cannot have length different than 2")
+
+        self.xlim = xlim
+        self.ylim = ylim
+        self.plane = plane
+        self.samples_inside = plane.get_samples(xlim, ylim) if samples_inside is None else samples_inside
+
+    @property
+    def n_samples(self):
+        return len(self.samples_inside)
+
+    def get_plot_rect(self):
+        return CustomRect(self.xlim, self.ylim)
+
+
+class RankRectangle:
+    """Rectangle whose samples are a slice of a permutation of the plane sample.
+
+    The rectangle holds no points of its own, only the range
+    ``index[start:stop]`` of a permutation shared by all rectangles of a
+    partition, so counting is O(1) and no data is copied at any depth.
+    """
+
+    def __init__(self, xlim, ylim, plane, index, start, stop):
         if len(xlim) != 2 or len(ylim) != 2:
             raise ValueError("xlim or ylim cannot have length different than 2")
 
         self.xlim = xlim
         self.ylim = ylim
         self.plane = plane
-        self.samples_inside = plane.get_samples(xlim, ylim)
+        self.index = index
+        self.start = start
+        self.stop = stop
+
+    @property
+    def n_samples(self):
+        return self.stop - self.start
+
+    @property
+    def samples_inside(self):
+        return self.plane.sample[self.index[self.start:self.stop]]
 
     def get_plot_rect(self):
         return CustomRect(self.xlim, self.ylim)
 
+
+class PartitionCell:
+    """Read-only view of a cell of an array-backed partition."""
+
+    __slots__ = ('xlim', 'ylim', 'n_samples')
+
+    def __init__(self, xlim, ylim, n_samples):
+        self.xlim = xlim
+        self.ylim = ylim
+        self.n_samples = n_samples
+
+    def get_plot_rect(self):
+        return CustomRect(self.xlim, self.ylim)
+
+
+class Partition:
+    """Partition of the plane stored as a structure of arrays.
+
+    Cell ``i`` is ``[xlo[i], xhi[i]) x [ylo[i], yhi[i])`` with ``counts[i]``
+    samples inside. ``parent`` optionally holds, for every cell, the id of the
+    rectangle that was split to obtain it (-1 for cells of the initial
+    partition). Iterating gives ``PartitionCell`` views, indexing with a slice
+    or an array gives a new ``Partition``.
+    """
+
+    def __init__(self, xlo, xhi, ylo, yhi, counts, parent=None):
+        self.xlo = np.asarray(xlo, dtype=np.float64)
+        self.xhi = np.asarray(xhi, dtype=np.float64)
+        self.ylo = np.asarray(ylo, dtype=np.float64)
+        self.yhi = np.asarray(yhi, dtype=np.float64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.parent = None if parent is None else np.asarray(parent, dtype=np.int64)
+
+    @classmethod
+    def from_rectangles(cls, rectangles):
+        limits = np.array([[*rect.xlim, *rect.ylim] for rect in rectangles], dtype=np.float64).reshape(-1, 4)
+        counts = np.array([rect.n_samples for rect in rectangles], dtype=np.int64)
+        return cls(*limits.T, counts)
+
+    def to_arrays(self):
+        """The arrays describing the partition, by name, as read back by ``from_arrays``."""
+        arrays = {"xlo": self.xlo, "xhi": self.xhi, "ylo": self.ylo, "yhi": self.yhi, "counts": self.counts}
+        if self.parent is not None:
+            arrays["parent"] = self.parent
+
+        return arrays
+
+    @staticmethod
+    def from_arrays(arrays):
+        """Partition of the arrays of ``to_arrays``, a ``GridPartition`` when they hold a grid."""
+        if "grid" in arrays:
+            return GridPartition(arrays["xedges"], arrays["yedges"], arrays["grid"])
+
+        return Partition(arrays["xlo"], arrays["xhi"], arrays["ylo"], arrays["yhi"], arrays["counts"],
+                         arrays["parent"] if "parent" in arrays else None)
+
+    def save(self, file):
+        """Save the partition arrays to a ``.npz`` file."""
+        np.savez(file, **self.to_arrays())
+
+    @staticmethod
+    def load(file):
+        with np.load(file) as arrays:
+            return Partition.from_arrays(arrays)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return PartitionCell([self.xlo[key], self.xhi[key]], [self.ylo[key], self.yhi[key]], self.counts[key])
+
+        return Partition(self.xlo[key], self.xhi[key], self.ylo[key], self.yhi[key], self.counts[key],
+                         None if self.parent is None else self.parent[key])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def get_plot_rect(self, *args, **kwargs):
+        """Single line collection drawing every cell of the partition."""
+        corners = [(self.xlo, self.ylo), (self.xlo, self.yhi), (self.xhi, self.yhi), (self.xhi, self.ylo)]
+        segments = [np.stack([np.column_stack(corners[i]), np.column_stack(corners[(i + 1) % 4])], axis=1)
+                    for i in range(4)]
+        return collections.LineCollection(np.concatenate(segments), *args, **kwargs)
+
+
+class PartitionTree:
+    """Refinement tree of an adaptive partition, stored as a structure of arrays.
+
+    Node 0 is the plane, split into the initial partition; every split
+    node ``i`` has the ``r ** 2`` children ``first_child[i] + ix * r + iy``,
+    cut by the ``r - 1`` inner partition points ``xsplits[i]`` and
+    ``ysplits[i]`` (NaN for leaves, whose ``first_child`` is -1). Node ``i``
+    is ``[xlo[i], xhi[i]) x [ylo[i], yhi[i])`` at ``depth[i]`` with
+    ``counts[i]`` samples inside, and ``cell[i]`` is the cell of the final
+    partition of a leaf (-1 for split nodes). Nodes are numbered level by
+    level, so children always come after their parent.
+    """
+
+    def __init__(self, xlo, xhi, ylo, yhi, counts, depth, first_child, xsplits, ysplits, cell, r):
+        self.xlo = xlo
+        self.xhi = xhi
+        self.ylo = ylo
+        self.yhi = yhi
+        self.counts = counts
+        self.depth = depth
+        self.first_child = first_child
+        self.xsplits = xsplits
+        self.ysplits = ysplits
+        self.cell = cell
+        self.r = r
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def max_depth(self):
+        return int(self.depth.max())
+
+    def locate(self, points):
+        """Leaf node of every point, -1 for the points outside the plane.
+
+        All points descend the tree together, one level per iteration, so a
+        batch is located in O(depth) array operations.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        x, y = points[:, 0], points[:, 1]
+        inside = (x >= self.xlo[0]) & (x < self.xhi[0]) & (y >= self.ylo[0]) & (y < self.yhi[0])
+
+        node = np.zeros(len(points), dtype=np.intp)
+        active = np.flatnonzero(inside & (self.first_child[0] >= 0))
+        while len(active) > 0:
+            parent = node[active]
+            # Same binning as the split test, a point equal to a split point goes right
+            ix = np.sum(x[active, None] >= self.xsplits[parent], axis=1)
+            iy = np.sum(y[active, None] >= self.ysplits[parent], axis=1)
+            node[active] = self.first_child[parent] + ix * self.r + iy
+            active = active[self.first_child[node[active]] >= 0]
+
+        return np.where(inside, node, -1)
+
+    def locate_cells(self, points):
+        """Cell of the final partition of every point, -1 for the points outside the plane."""
+        node = self.locate(points)
+        return np.where(node >= 0, self.cell[np.maximum(node, 0)], -1)
+
+    def cut(self, expand):
+        """Leaves of the tree where only the nodes of the boolean mask ``expand`` are split.
+
+        The root is always split, it stands for the initial partition.
+        """
+        expand = expand & (self.first_child >= 0)
+        expand[0] = self.first_child[0] >= 0
+
+        leaves = []
+        current = np.array([0])
+        while len(current) > 0:
+            split = expand[current]
+            leaves.append(current[~split])
+            current = (self.first_child[current[split], None] + np.arange(self.r ** 2)).ravel()
+
+        return np.sort(np.concatenate(leaves))
+
+    def prune(self, max_depth=None, min_count=None):
+        """Coarsened partition: nodes at ``max_depth`` or with fewer than ``min_count`` samples are not split.
+
+        ``prune(max_depth=d)`` gives the counts of the partition at depth
+        ``d``, ``prune()`` the cells of the final partition. The cells of
+        the returned ``Partition`` are in node order.
+        """
+        expand = np.ones(len(self), dtype=bool)
+        if max_depth is not None:
+            expand &= self.depth < max_depth
+        if min_count is not None:
+            expand &= self.counts >= min_count
+
+        nodes = self.cut(expand)
+        return Partition(self.xlo[nodes], self.xhi[nodes], self.ylo[nodes], self.yhi[nodes], self.counts[nodes])
+
+
+class TreeBuilder:
+    """Blocks of nodes of a ``PartitionTree``, added level by level during a run."""
+
+    def __init__(self, r):
+        self.r = r
+        self.n_nodes = 0
+        self.nodes = []
+        self.expansions = []
+        self.leaves = []
+
+    def add_nodes(self, lims, counts, depth):
+        self.nodes.append((*[np.asarray(lim, dtype=np.float64) for lim in lims], np.asarray(counts, dtype=np.int64),
+                           np.full(len(counts), depth)))
+        self.n_nodes += len(counts)
+
+    def expand(self, nodes, xsplits, ysplits):
+        """Split ``nodes``, the ids of their children, to be added next, in order."""
+        n_children = len(nodes) * self.r ** 2
+        self.expansions.append((np.asarray(nodes, dtype=np.intp),
+                                self.n_nodes + self.r ** 2 * np.arange(len(nodes)), xsplits, ysplits))
+        return self.n_nodes + np.arange(n_children)
+
+    def add_leaves(self, nodes):
+        """Leaves, in the order of their cells in the final partition."""
+        self.leaves.append(nodes)
+
+    def build(self):
+        xlo, xhi, ylo, yhi, counts, depth = [np.concatenate(arrays) for arrays in zip(*self.nodes)]
+
+        first_child = np.full(self.n_nodes, -1)
+        xsplits = np.full((self.n_nodes, self.r - 1), np.nan)
+        ysplits = np.full((self.n_nodes, self.r - 1), np.nan)
+        for nodes, first, xs, ys in self.expansions:
+            first_child[nodes] = first
+            xsplits[nodes] = xs
+            ysplits[nodes] = ys
+
+        leaves = np.concatenate(self.leaves)
+        cell = np.full(self.n_nodes, -1)
+        cell[leaves] = np.arange(len(leaves))
+
+        return PartitionTree(xlo, xhi, ylo, yhi, counts, depth, first_child, xsplits, ysplits, cell, self.r)
+
+
 class Plane:
+    """Bounding box of a sample, with sorted-marginal and counting indexes.
+
+    ``sorted_marginals`` and ``ranks`` may be given when they are already
+    known (e.g. shared between the pairs of columns of a table), they must
+    then describe the samples inside the plane, see ``sorted_marginals`` and
+    ``ranks``.
+    """
 
-    def __init__(self, sample):
+    def __init__(self, sample, sorted_marginals=None, ranks=None):
         self.sample = sample
 
         xmin, ymin = np.min(sample, axis=0)
@@ -42,17 +316,250 @@ class Plane:
         self.xlim = [xmin, xmax]
         self.ylim = [ymin, ymax]
 
-    def get_samples(self, xlim, ylim):
+        self._sorted_marginals = sorted_marginals
+        self._ranks = ranks
+        self._count_tree = None
+
+    def get_mask(self, xlim, ylim):
         xlimit = (self.sample[:, 0] >= xlim[0]) & (self.sample[:, 0] < xlim[1])
         ylimit = (self.sample[:, 1] >= ylim[0]) & (self.sample[:, 1] < ylim[1])
-        return self.sample[xlimit & ylimit]
+        return xlimit & ylimit
+
+    def get_samples(self, xlim, ylim):
+        return self.sample[self.get_mask(xlim, ylim)]
+
+    def sorted_marginals(self):
+        """Sort the marginals of the samples inside the plane.
+
+        The sort is done once and cached, every later rank or quantile
+        query on the plane is answered from these arrays.
+        """
+        if self._sorted_marginals is None:
+            inside = self.get_samples(self.xlim, self.ylim)
+            self._sorted_marginals = (np.sort(inside[:, 0]), np.sort(inside[:, 1]))
+
+        return self._sorted_marginals
+
+    def ranks(self):
+        """Ranks of the samples inside the plane in the sorted marginals.
+
+        The rank of a value is the number of samples strictly below it, so
+        ``lo <= v < hi`` iff ``rank(lo) <= rank(v) < rank(hi)``.
+        """
+        if self._ranks is None:
+            inside = self.get_samples(self.xlim, self.ylim)
+            x_sorted, y_sorted = self.sorted_marginals()
+            self._ranks = (np.searchsorted(x_sorted, inside[:, 0], side='left'),
+                           np.searchsorted(y_sorted, inside[:, 1], side='left'))
+
+        return self._ranks
+
+    @property
+    def x_sorted(self):
+        return self.sorted_marginals()[0]
+
+    @property
+    def y_sorted(self):
+        return self.sorted_marginals()[1]
+
+    def strip_range(self, lim, axis):
+        """Index range in the sorted marginal of the strip ``lim[0] <= v < lim[1]``."""
+        marg = self.sorted_marginals()[axis]
+        return np.searchsorted(marg, lim, side='left')
+
+    def strip_quantiles(self, lim, axis, partition_size):
+        """Lower quantiles ``j / partition_size`` of the marginal inside a strip.
+
+        Equivalent to ``np.quantile(strip, j / partition_size, interpolation='lower')``
+        over the samples of the strip, without scanning or copying them.
+        """
+        marg = self.sorted_marginals()[axis]
+        lo, hi = self.strip_range(lim, axis)
+        quantiles = np.arange(1, partition_size) / partition_size
+        return marg[lo + np.floor((hi - lo - 1) * quantiles).astype(np.intp)]
+
+    def strip_count(self, lim, axis):
+        """Number of samples inside the plane in the strip ``lim[0] <= v < lim[1]``."""
+        lo, hi = self.strip_range(lim, axis)
+        return hi - lo
+
+    def count_tree(self):
+        """Merge-sort tree over the samples inside the plane.
+
+        Samples are ordered by x and level ``l`` holds, for every block of
+        ``2 ** l`` consecutive samples, the sorted y ranks of the block. Each
+        level is stored as a single sorted array of ``block * (n + 1) + y_rank``
+        keys, so one ``searchsorted`` counts inside many blocks at once. The
+        tree takes O(N log N) memory and is built once, on first use.
+        """
+        if self._count_tree is None:
+            inside = self.get_samples(self.xlim, self.ylim)
+            x_sorted, y_sorted = self.sorted_marginals()
+            n = len(inside)
+
+            y_rank = np.searchsorted(y_sorted, inside[np.argsort(inside[:, 0], kind='stable'), 1], side='left')
+            keys = np.arange(n, dtype=np.int64) * (n + 1) + y_rank
+            levels = [keys]
+            while (1 << (len(levels) - 1)) < n:
+                block, rank = np.divmod(keys, n + 1)
+                # Consecutive blocks are already sorted runs, a stable sort merges them
+                keys = np.sort((block >> 1) * (n + 1) + rank, kind='stable')
+                levels.append(keys)
+
+            self._count_tree = levels
+
+        return self._count_tree
+
+    def count_many(self, xlo, xhi, ylo, yhi):
+        """Vectorized ``count`` over arrays of rectangle limits."""
+        x_sorted, y_sorted = self.sorted_marginals()
+        n = len(x_sorted)
+
+        lo = np.searchsorted(x_sorted, xlo, side='left').astype(np.int64)
+        hi = np.searchsorted(x_sorted, xhi, side='left').astype(np.int64)
+        ylo_rank = np.searchsorted(y_sorted, ylo, side='left')
+        yhi_rank = np.searchsorted(y_sorted, yhi, side='left')
+        counts = np.zeros(np.broadcast(lo, hi, ylo_rank, yhi_rank).shape, dtype=np.int64)
+
+        lo, hi, ylo_rank, yhi_rank = np.broadcast_arrays(lo, hi, ylo_rank, yhi_rank)
+        lo, hi = lo.copy(), hi.copy()
+
+        # Canonical dyadic decomposition of the x range [lo, hi), level by level
+        for keys in self.count_tree():
+            active = lo < hi
+            if not active.any():
+                break
+
+            for block in [np.where(active & ((lo & 1) == 1), lo, -1),
+                          np.where(active & ((hi & 1) == 1), hi - 1, -1)]:
+                taken = block >= 0
+                base = block[taken] * (n + 1)
+                counts[taken] += (np.searchsorted(keys, base + yhi_rank[taken], side='left') -
+                                  np.searchsorted(keys, base + ylo_rank[taken], side='left'))
+
+            lo = (lo + (lo & 1)) >> 1
+            hi = (hi - (hi & 1)) >> 1
+
+        return counts
+
+    def count(self, xlim, ylim):
+        """Number of samples inside ``xlim`` x ``ylim``, in O(log^2 N).
+
+        Gives ``len(self.get_samples(xlim, ylim))`` for rectangles within the
+        plane, without scanning or materializing the samples.
+        """
+        return int(self.count_many(xlim[0], xlim[1], ylim[0], ylim[1]))
+
+    def count_grid(self, xpart, ypart):
+        """Counts of the grid of rectangles defined by the partition points."""
+        xlo, ylo = np.meshgrid(xpart[:-1], ypart[:-1], indexing='ij')
+        xhi, yhi = np.meshgrid(xpart[1:], ypart[1:], indexing='ij')
+        return self.count_many(xlo, xhi, ylo, yhi)
+
+
+def peak_rss():
+    """Peak resident set size of the process in bytes, None where not available."""
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class LevelStats:
+    """Counters and timings of one refinement level of an adaptive run.
+
+    ``frontier`` rectangles are processed at the level, ``tests_s`` and
+    ``tests_s2`` chi-square tests are evaluated on the ``s`` and ``s ** 2``
+    grids, of which ``passed_s`` and ``passed_s2`` lead to a split.
+    ``next_frontier`` rectangles go on to the next level. Times are in
+    seconds: ``test_time`` to subpartition rectangles and evaluate the tests,
+    ``split_time`` to build children, ``time`` for the whole level.
+    ``peak_rss`` is the peak resident memory of the process at the end of
+    the level, in bytes.
+    """
+
+    def __init__(self, level, frontier):
+        self.level = level
+        self.frontier = frontier
+        self.tests_s = 0
+        self.tests_s2 = 0
+        self.passed_s = 0
+        self.passed_s2 = 0
+        self.next_frontier = 0
+        self.test_time = 0.
+        self.split_time = 0.
+        self.time = 0.
+        self.peak_rss = None
+
+    @property
+    def tests(self):
+        return self.tests_s + self.tests_s2
+
+    @property
+    def splits(self):
+        return self.passed_s + self.passed_s2
+
+    def count_tests(self, is_s, tests, passed):
+        if is_s:
+            self.tests_s += tests
+            self.passed_s += passed
+        else:
+            self.tests_s2 += tests
+            self.passed_s2 += passed
+
+    def as_dict(self):
+        return {**vars(self), "tests": self.tests, "splits": self.splits}
+
+
+class RunStats:
+    """Instrumentation of an adaptive run, one ``LevelStats`` per refinement level."""
+
+    def __init__(self, on_level=None):
+        self.levels = []
+        self.on_level = on_level
+        self._level_start = None
+
+    def start_level(self, frontier):
+        level = LevelStats(len(self.levels), frontier)
+        self.levels.append(level)
+        self._level_start = time.perf_counter()
+        return level
+
+    def end_level(self, level, next_frontier):
+        level.time = time.perf_counter() - self._level_start
+        level.next_frontier = next_frontier
+        level.peak_rss = peak_rss()
+
+        if self.on_level is not None:
+            self.on_level(level)
+
+    @property
+    def depth(self):
+        return len(self.levels)
+
+    @property
+    def time(self):
+        return sum(level.time for level in self.levels)
+
+    @property
+    def tests(self):
+        return sum(level.tests for level in self.levels)
+
+    @property
+    def peak_rss(self):
+        return self.levels[-1].peak_rss if self.levels else None
+
+    def as_dict(self):
+        return {"depth": self.depth, "time": self.time, "tests": self.tests, "peak_rss": self.peak_rss,
+                "levels": [level.as_dict() for level in self.levels]}
 
 
 class AdaptiveAlgorithm:
 
-    def __init__(self, sample, delta, r, s):
+    def __init__(self, sample, delta, r, s, plane=None):
         self.sample = sample
-        self.plane = Plane(sample)
+        self.plane = Plane(sample) if plane is None else plane
         self.current_partition = None
         self.delta = delta
         self.r = r
@@ -82,6 +589,10 @@ class AdaptiveAlgorithm:
 
     @staticmethod
     def plot_partition(ax, partition):
+        if isinstance(partition, Partition):
+            ax.add_collection(partition.get_plot_rect())
+            return
+
         for rect in partition:
             r_fig = rect.get_plot_rect()
             ax.add_collection(r_fig)
@@ -90,27 +601,75 @@ class AdaptiveAlgorithm:
     def plot_data(sample, ax, *args, **kwargs):
         ax.plot(*list(zip(*sample)), 'o', *args, **kwargs)
 
+    def subpartition_limits(self, rect, partition_size):
+        """Partition points of the equiprobable subpartition of a rectangle.
+
+        The quantiles of the conditional marginals are read from the sorted
+        marginals of the plane.
+        """
+        xpartition = [rect.xlim[0], *self.plane.strip_quantiles(rect.xlim, 0, partition_size), rect.xlim[1]]
+        ypartition = [rect.ylim[0], *self.plane.strip_quantiles(rect.ylim, 1, partition_size), rect.ylim[1]]
+
+        return xpartition, ypartition
+
     def rectangle_subpartition(self, rect, partition_size):
         xmarg_rect = SmartRectangle(rect.xlim, self.plane.ylim, self.plane)
         ymarg_rect = SmartRectangle(self.plane.xlim, rect.ylim, self.plane)
 
-        margx, _ = list(zip(*xmarg_rect.samples_inside))
-        _, margy = list(zip(*ymarg_rect.samples_inside))
+        xpartition, ypartition = self.subpartition_limits(rect, partition_size)
 
-        condx = np.array(margx)
-        condy = np.array(margy)
+        return self.points_to_partition(xpartition, ypartition), xmarg_rect, ymarg_rect
 
-        xpartition = rect.xlim[:]
-        ypartition = rect.ylim[:]
+    def subpartition(self, rect, partition_size, cache):
+        """Subpartition of a rectangle, as its partition points and the child of every sample.
 
-        for j in range(1, partition_size):
-            xpartition.insert(j, np.quantile(condx, j / partition_size, interpolation='lower'))
-            ypartition.insert(j, np.quantile(condy, j / partition_size, interpolation='lower'))
+        Results are cached by size in ``cache``. The samples of the rectangle
+        are binned only once, on the ``s ** 2`` grid of the split test: the
+        partition points of a grid whose size divides it are every ``k``-th
+        partition point of the finer grid, so its children are derived from
+        the fine ones by integer division instead of binning the samples again.
+        """
+        if partition_size not in cache:
+            finest = self.s ** 2
 
-        return self.points_to_partition(xpartition, ypartition), xmarg_rect, ymarg_rect
+            if partition_size != finest and finest % partition_size == 0:
+                xpartition, ypartition, child = self.subpartition(rect, finest, cache)
+                k = finest // partition_size
+                xbin, ybin = np.divmod(child, finest)
+                cache[partition_size] = xpartition[::k], ypartition[::k], (xbin // k) * partition_size + ybin // k
 
-    def run(self):
+            else:
+                xpartition, ypartition = self.subpartition_limits(rect, partition_size)
+                samples = rect.samples_inside
+                xbin = np.searchsorted(xpartition[1:-1], samples[:, 0], side='right')
+                ybin = np.searchsorted(ypartition[1:-1], samples[:, 1], side='right')
+                cache[partition_size] = xpartition, ypartition, xbin * partition_size + ybin
+
+        return cache[partition_size]
 
+    def split_rectangle(self, rect, xpartition, ypartition, child):
+        """Children of a rectangle, built from its own samples without scanning the plane."""
+        nx, ny = len(xpartition) - 1, len(ypartition) - 1
+        samples = rect.samples_inside[np.argsort(child, kind='stable')]
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(child, minlength=nx * ny))))
+
+        smart_rects = []
+        for ix in range(nx):
+            for iy in range(ny):
+                k = ix * ny + iy
+                smart_rects.append(SmartRectangle([xpartition[ix], xpartition[ix + 1]], [ypartition[iy], ypartition[iy + 1]],
+                                                  self.plane, samples_inside=samples[bounds[k]:bounds[k + 1]]))
+
+        return smart_rects
+
+    def run(self, stats=False, on_level=None):
+        """Run the algorithm and return the final partition.
+
+        Instrumentation is opt-in: with ``stats`` the return value is
+        ``(partition, RunStats)``, and ``on_level`` is called with the
+        ``LevelStats`` of every refinement level as soon as it is done.
+        """
+        run_stats = RunStats(on_level) if stats or on_level is not None else None
         self.initialize_partition()
 
         # While partition is changing
@@ -118,31 +677,46 @@ class AdaptiveAlgorithm:
             # Step 1: Generate next partition
             r_k = self.current_partition[:]
             r_next = []
+            level = run_stats.start_level(len(r_k)) if run_stats is not None else None
 
             # For each rectangle in current partition
             for rect in r_k:
                 # If the rectangle doesnt have samples inside, dont divide it
-                if len(rect.samples_inside) <= 2:
+                if rect.n_samples <= 2:
                     self.rfinal.append(rect)
 
                 # Otherwise...
                 else:
                     # Calculate subpartition of rectangle with s parameter
                     added = False
+                    cache = {}
                     for val in [self.s, self.s ** 2]:
-                        e_val = len(rect.samples_inside) / (val ** 2)
-                        subp, __, __ = self.rectangle_subpartition(rect, val)
+                        e_val = rect.n_samples / (val ** 2)
+                        if level is not None:
+                            t0 = time.perf_counter()
 
-                        num_samples_child = np.array([len(r.samples_inside) for r in subp])
+                        _, _, child = self.subpartition(rect, val, cache)
+
+                        num_samples_child = np.bincount(child, minlength=val ** 2)
 
                         estimate = np.sum(np.square(num_samples_child - e_val)) / e_val
 
+                        if level is not None:
+                            level.count_tests(val == self.s, 1, int(estimate >= self.delta(val)))
+                            level.test_time += time.perf_counter() - t0
+
                         if estimate >= self.delta(val):
-                            r_subp, _, _ = self.rectangle_subpartition(rect, self.r)
+                            if level is not None:
+                                t0 = time.perf_counter()
+
+                            r_subp = self.split_rectangle(rect, *self.subpartition(rect, self.r, cache))
+
+                            if level is not None:
+                                level.split_time += time.perf_counter() - t0
 
                             for r in r_subp:
 
-                                if len(r.samples_inside) > 2:
+                                if r.n_samples > 2:
                                     r_next.append(r)
 
                                 else:
@@ -156,11 +730,285 @@ class AdaptiveAlgorithm:
 
             self.current_partition = r_next
 
+            if level is not None:
+                run_stats.end_level(level, len(r_next))
+
             # Step 2: End if partition didn't change in last iteration
             if len(self.current_partition) == 0:
                 break
 
-        return self.rfinal        
+        self.rfinal = Partition.from_rectangles(self.rfinal)
+
+        if stats:
+            return self.rfinal, run_stats
+
+        return self.rfinal
+
+
+class RankAdaptiveAlgorithm(AdaptiveAlgorithm):
+    """Adaptive algorithm working on index ranges of a pre-sorted sample.
+
+    The plane sorts both marginals once; conditional quantiles are read from
+    those sorted arrays and every rectangle is a ``RankRectangle``, i.e. a
+    slice of a single permutation of the sample. Splitting a rectangle only
+    reorders its own slice, so each level costs O(N log N) in total instead
+    of O(N) per rectangle, and the produced partition is the same as the one
+    of ``AdaptiveAlgorithm``.
+    """
+
+    def __init__(self, sample, delta, r, s, plane=None):
+        super().__init__(sample, delta, r, s, plane)
+        self.index = None
+
+    def initialize_partition(self):
+        # Generate equiprobable partition
+        quantiles = np.arange(1, self.r) / self.r
+        xpartition = [self.plane.xlim[0], *np.quantile(self.sample[:, 0], quantiles), self.plane.xlim[1]]
+        ypartition = [self.plane.ylim[0], *np.quantile(self.sample[:, 1], quantiles), self.plane.ylim[1]]
+
+        self.index = np.flatnonzero(self.plane.get_mask(self.plane.xlim, self.plane.ylim))
+        self.current_partition = self.points_to_partition(xpartition, ypartition, 0, len(self.index))
+        self.rfinal = []
+
+    def points_to_partition(self, xpart, ypart, start, stop, child=None):
+        """Split the slice ``index[start:stop]`` into the rectangles of the grid.
+
+        The slice is reordered in place so that the samples of every child
+        rectangle are contiguous, rectangles are ordered as in the base class.
+        ``child`` gives the child of every sample of the slice when already known.
+        """
+        nx, ny = len(xpart) - 1, len(ypart) - 1
+        idx = self.index[start:stop]
+
+        if child is None:
+            xbin = np.searchsorted(xpart[1:-1], self.sample[idx, 0], side='right')
+            ybin = np.searchsorted(ypart[1:-1], self.sample[idx, 1], side='right')
+            child = xbin * ny + ybin
+
+        self.index[start:stop] = idx[np.argsort(child, kind='stable')]
+        bounds = start + np.concatenate(([0], np.cumsum(np.bincount(child, minlength=nx * ny))))
+
+        rank_rects = []
+        for ix in range(nx):
+            for iy in range(ny):
+                k = ix * ny + iy
+                rank_rects.append(RankRectangle([xpart[ix], xpart[ix + 1]], [ypart[iy], ypart[iy + 1]], self.plane,
+                                                self.index, bounds[k], bounds[k + 1]))
+
+        return rank_rects
+
+    def rectangle_subpartition(self, rect, partition_size):
+        """Subpartition a rectangle using the plane sorted marginals.
+
+        Instead of the marginal strips, the conditional marginals are returned
+        as views of the sorted marginals of the plane.
+        """
+        xpartition, ypartition = self.subpartition_limits(rect, partition_size)
+
+        xlo, xhi = self.plane.strip_range(rect.xlim, 0)
+        ylo, yhi = self.plane.strip_range(rect.ylim, 1)
+
+        return (self.points_to_partition(xpartition, ypartition, rect.start, rect.stop),
+                self.plane.x_sorted[xlo:xhi], self.plane.y_sorted[ylo:yhi])
+
+    def split_rectangle(self, rect, xpartition, ypartition, child):
+        return self.points_to_partition(xpartition, ypartition, rect.start, rect.stop, child)
+
+
+class BatchedAdaptiveAlgorithm(AdaptiveAlgorithm):
+    """Level-synchronous adaptive algorithm.
+
+    Each refinement level is processed at once: the conditional quantile
+    splits of every frontier rectangle, the child of every sample, all the
+    chi-square statistics and the comparisons against ``delta`` are array
+    operations over the whole level, so a level costs a fixed number of NumPy
+    calls instead of a Python iteration per rectangle. Samples are handled
+    through their ranks in the sorted marginals of the plane. ``run`` returns
+    the same partition, in the same order, as ``AdaptiveAlgorithm``, with
+    parent ids, and leaves in ``index`` a permutation of the sample grouping
+    the samples of every cell, in cell order, and in ``tree`` the
+    ``PartitionTree`` of the refinement.
+    """
+
+    def __init__(self, sample, delta, r, s, plane=None):
+        super().__init__(sample, delta, r, s, plane)
+        self.index = None
+        self.tree = None
+
+    def level_splits(self, lo, hi, ranks, cell, axis, partition_size):
+        """Split points of every rectangle of a level along one axis.
+
+        Returns the ``(rectangles, partition_size - 1)`` array of lower
+        conditional quantiles and, for every sample, the index of the child
+        interval of its rectangle it falls in.
+        """
+        marg = self.plane.sorted_marginals()[axis]
+        strip_lo = np.searchsorted(marg, lo, side='left')
+        strip_hi = np.searchsorted(marg, hi, side='left')
+
+        quantiles = np.arange(1, partition_size) / partition_size
+        idx = strip_lo[:, None] + np.floor((strip_hi - strip_lo - 1)[:, None] * quantiles).astype(np.intp)
+        splits = marg[np.clip(idx, 0, len(marg) - 1)]
+
+        # A sample is right of a split iff its rank is not below the rank of the split.
+        # Rows are sorted and offset by rectangle, so one searchsorted bins every sample.
+        stride = len(marg) + 1
+        keys = (np.arange(len(lo))[:, None] * stride + np.searchsorted(marg, splits, side='left')).ravel()
+        bins = np.searchsorted(keys, cell * stride + ranks, side='right') - cell * (partition_size - 1)
+
+        return splits, bins
+
+    def initial_splits(self):
+        """Inner partition points of the equiprobable initial partition, along x and y."""
+        quantiles = np.arange(1, self.r) / self.r
+        return np.quantile(self.sample[:, 0], quantiles), np.quantile(self.sample[:, 1], quantiles)
+
+    def run(self, stats=False, on_level=None):
+        """Run the algorithm and return the final partition, see ``AdaptiveAlgorithm.run`` for ``stats`` and ``on_level``."""
+        run_stats = RunStats(on_level) if stats or on_level is not None else None
+
+        inside = np.flatnonzero(self.plane.get_mask(self.plane.xlim, self.plane.ylim))
+        xrank, yrank = self.plane.ranks()
+
+        # Generate equiprobable partition
+        xsplits, ysplits = self.initial_splits()
+        xpartition = np.array([self.plane.xlim[0], *xsplits, self.plane.xlim[1]])
+        ypartition = np.array([self.plane.ylim[0], *ysplits, self.plane.ylim[1]])
+
+        xlo, xhi = np.repeat(xpartition[:-1], self.r), np.repeat(xpartition[1:], self.r)
+        ylo, yhi = np.tile(ypartition[:-1], self.r), np.tile(ypartition[1:], self.r)
+
+        # Samples still in the frontier and the frontier rectangle they are in
+        points = np.arange(len(inside))
+        cell = (np.searchsorted(xsplits, self.sample[inside, 0], side='right') * self.r +
+                np.searchsorted(ysplits, self.sample[inside, 1], side='right'))
+
+        final_id = np.empty(len(inside), dtype=np.intp)
+        final_cells = []
+        n_final = 0
+        # Rectangles are numbered level by level, in the order they are tested
+        parent = np.full(len(xlo), -1)
+        n_tested = 0
+        n_children = self.r ** 2
+        thresholds = {val: self.delta(val) for val in [self.s, self.s ** 2]}
+
+        # Refinement tree, node 0 is the plane, split into the initial partition
+        tree = TreeBuilder(self.r)
+        tree.add_nodes([[self.plane.xlim[0]], [self.plane.xlim[1]], [self.plane.ylim[0]], [self.plane.ylim[1]]],
+                       [len(inside)], 0)
+        node = tree.expand([0], xsplits[None, :], ysplits[None, :])
+        tree.add_nodes([xlo, xhi, ylo, yhi], np.bincount(cell, minlength=n_children), 1)
+        depth = 1
+
+        while len(xlo) > 0:
+            n_cells = len(xlo)
+            n_samples = np.bincount(cell, minlength=n_cells)
+            if run_stats is not None:
+                level = run_stats.start_level(n_cells)
+                t0 = time.perf_counter()
+
+            # Step 1: chi-square tests of every rectangle of the level
+            # Samples are binned once on the s ** 2 grid, coarser grids dividing it are derived
+            level_bins = {}
+            finest = self.s ** 2
+            for val in [finest, self.s, self.r]:
+                if val in level_bins:
+                    continue
+
+                if val != finest and finest % val == 0:
+                    xsplits, ysplits, xbin, ybin = level_bins[finest]
+                    k = finest // val
+                    level_bins[val] = xsplits[:, k - 1::k], ysplits[:, k - 1::k], xbin // k, ybin // k
+
+                else:
+                    xsplits, xbin = self.level_splits(xlo, xhi, xrank[points], cell, 0, val)
+                    ysplits, ybin = self.level_splits(ylo, yhi, yrank[points], cell, 1, val)
+                    level_bins[val] = xsplits, ysplits, xbin, ybin
+
+            split = np.zeros(n_cells, dtype=bool)
+            undecided = n_samples > 2
+            for val in [self.s, self.s ** 2]:
+                if run_stats is not None:
+                    tested = np.count_nonzero(undecided)
+
+                e_val = n_samples / (val ** 2)
+                _, _, xbin, ybin = level_bins[val]
+                num_samples_child = np.bincount(cell * val ** 2 + xbin * val + ybin,
+                                                minlength=n_cells * val ** 2).reshape(n_cells, val ** 2)
+
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    estimate = np.sum(np.square(num_samples_child - e_val[:, None]), axis=1) / e_val
+
+                passed = undecided & (estimate >= thresholds[val])
+                split |= passed
+                undecided &= ~passed
+
+                if run_stats is not None:
+                    level.count_tests(val == self.s, tested, np.count_nonzero(passed))
+
+            if run_stats is not None:
+                level.test_time = time.perf_counter() - t0
+                t0 = time.perf_counter()
+
+            # Step 2: children of the rectangles that passed a test
+            xsplits, ysplits, xbin, ybin = level_bins[self.r]
+            child = xbin * self.r + ybin
+            xpart = np.concatenate([xlo[:, None], xsplits, xhi[:, None]], axis=1)
+            ypart = np.concatenate([ylo[:, None], ysplits, yhi[:, None]], axis=1)
+            ix, iy = np.divmod(np.arange(n_children), self.r)
+
+            child_lims = [xpart[:, ix].ravel(), xpart[:, ix + 1].ravel(), ypart[:, iy].ravel(), ypart[:, iy + 1].ravel()]
+            child_n = np.bincount(cell * n_children + child, minlength=n_cells * n_children)
+            child_parent = n_tested + np.repeat(np.arange(n_cells), n_children)
+            is_child = np.repeat(split, n_children)
+            is_next = is_child & (child_n > 2)
+
+            # Final rectangles of the level, keyed by (rectangle, child) to keep the order of the base class
+            keep = np.flatnonzero(~split)
+            small = np.flatnonzero(is_child & ~is_next)
+            keys = np.concatenate([keep * n_children, small])
+            order = np.argsort(keys)
+            lims = [np.concatenate([lim[keep], child_lim[small]])[order]
+                    for lim, child_lim in zip([xlo, xhi, ylo, yhi], child_lims)]
+            final_cells.append((*lims, np.concatenate([n_samples[keep], child_n[small]])[order],
+                                np.concatenate([parent[keep], child_parent[small]])[order]))
+
+            final_lookup = np.full(n_cells * n_children, -1)
+            final_lookup[keys[order]] = n_final + np.arange(len(keys))
+            n_final += len(keys)
+
+            child_node = np.full(n_cells * n_children, -1)
+            child_node[is_child] = tree.expand(node[split], xsplits[split], ysplits[split])
+            tree.add_nodes([lim[is_child] for lim in child_lims], child_n[is_child], depth + 1)
+            tree.add_leaves(np.concatenate([node[keep], child_node[small]])[order])
+
+            next_cells = np.flatnonzero(is_next)
+            next_lookup = np.full(n_cells * n_children, -1)
+            next_lookup[next_cells] = np.arange(len(next_cells))
+
+            point_key = cell * n_children + np.where(split[cell], child, 0)
+            done = final_lookup[point_key] >= 0
+            final_id[points[done]] = final_lookup[point_key[done]]
+
+            points, cell = points[~done], next_lookup[point_key[~done]]
+            xlo, xhi, ylo, yhi = [lim[next_cells] for lim in child_lims]
+            parent = child_parent[next_cells]
+            node = child_node[next_cells]
+            n_tested += n_cells
+            depth += 1
+
+            if run_stats is not None:
+                level.split_time = time.perf_counter() - t0
+                run_stats.end_level(level, len(next_cells))
+
+        self.index = inside[np.argsort(final_id, kind='stable')]
+        self.rfinal = Partition(*[np.concatenate(arrays) for arrays in zip(*final_cells)])
+        self.tree = tree.build()
+
+        if stats:
+            return self.rfinal, run_stats
+
+        return self.rfinal
 
 
 class NonAdaptivePartition:
@@ -184,7 +1032,7 @@ class NonAdaptivePartition:
         for j in range(1, self.bins[1]):
             ypartition.insert(j, np.quantile(ymarg, j / self.bins[1]))
 
-        self.rfinal =  self.points_to_partition(xpartition, ypartition)
+        self.rfinal = Partition.from_rectangles(self.points_to_partition(xpartition, ypartition))
 
     def points_to_partition(self, xpart, ypart):
         smart_rects = []
@@ -198,4 +1046,68 @@ class NonAdaptivePartition:
 
         self.initialize_partition()
 
-        return self.rfinal
\ No newline at end of file
+        return self.rfinal
+
+
+class GridPartition(Partition):
+    """Product partition stored as its edges and the grid of cell counts.
+
+    ``grid[ix, iy]`` is the number of samples in
+    ``[xedges[ix], xedges[ix + 1]) x [yedges[iy], yedges[iy + 1])``, the
+    marginal counts of the cells are the row and column sums. Cells are also
+    available as a flat ``Partition``, in the same order as ``grid.ravel()``.
+    """
+
+    def __init__(self, xedges, yedges, grid):
+        self.xedges = np.asarray(xedges, dtype=np.float64)
+        self.yedges = np.asarray(yedges, dtype=np.float64)
+        self.grid = np.asarray(grid, dtype=np.int64)
+
+        xlo, ylo = np.meshgrid(self.xedges[:-1], self.yedges[:-1], indexing='ij')
+        xhi, yhi = np.meshgrid(self.xedges[1:], self.yedges[1:], indexing='ij')
+        super().__init__(xlo.ravel(), xhi.ravel(), ylo.ravel(), yhi.ravel(), self.grid.ravel())
+
+    def to_arrays(self):
+        return {"xedges": self.xedges, "yedges": self.yedges, "grid": self.grid}
+
+
+class HistogramPartition(NonAdaptivePartition):
+    """Non adaptive partition computed as a 2-D histogram.
+
+    The equiprobable edges are computed with a single ``np.quantile`` call
+    per axis and all cell counts come out of one ``np.digitize`` and
+    ``np.bincount`` pass, so the cost is O(N log bins) whatever the number
+    of cells. ``run`` returns a ``GridPartition`` with the same cells as
+    ``NonAdaptivePartition``.
+    """
+
+    def initialize_partition(self):
+        # Generate equiprobable partition
+        xquantiles = np.quantile(self.plane.sample[:, 0], np.arange(1, self.bins[0]) / self.bins[0])
+        yquantiles = np.quantile(self.plane.sample[:, 1], np.arange(1, self.bins[1]) / self.bins[1])
+
+        xpartition = np.array([self.plane.xlim[0], *xquantiles, self.plane.xlim[1]])
+        ypartition = np.array([self.plane.ylim[0], *yquantiles, self.plane.ylim[1]])
+
+        self.rfinal = self.points_to_partition(xpartition, ypartition)
+
+    def points_to_partition(self, xpart, ypart):
+        nx, ny = len(xpart) - 1, len(ypart) - 1
+
+        xbin = np.digitize(self.plane.sample[:, 0], xpart) - 1
+        ybin = np.digitize(self.plane.sample[:, 1], ypart) - 1
+        inside = (xbin >= 0) & (xbin < nx) & (ybin >= 0) & (ybin < ny)
+
+        grid = np.bincount(xbin[inside] * ny + ybin[inside], minlength=nx * ny).reshape(nx, ny)
+
+        return GridPartition(xpart, ypart, grid)
+
+
+def tabulate_delta(delta, s):
+    """Picklable stand-in for ``delta``, tabulated at the sizes of the split test.
+
+    The adaptive algorithms only evaluate ``delta(s)`` and ``delta(s ** 2)``,
+    the returned lookup can be sent to worker processes even when ``delta``
+    is a lambda.
+    """
+    return {val: delta(val) for val in [s, s ** 2]}.__getitem__
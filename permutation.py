@@ -0,0 +1,139 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import beta
+
+from divergence_utils import kl_estimate
+from mi_matrix import attach_arrays, shared_arrays
+from partition import BatchedAdaptiveAlgorithm, Plane, tabulate_delta
+
+
+class PermutationEstimator:
+    """Adaptive partition MI estimate of a sample with its y marginal permuted.
+
+    Permuting y leaves both marginals unchanged, so the sample is taken to
+    rank space once: ``xrank`` and ``yrank`` hold the position of every
+    sample in the sorted marginals (ties broken by order of appearance) and
+    the sorted marginals of every permutation are ``0, ..., N - 1``. Only
+    the pairing of the ranks, i.e. joint cell membership, changes from one
+    permutation to the next.
+    """
+
+    def __init__(self, xrank, yrank, delta, r, s, log_base):
+        self.xrank = xrank
+        self.yrank = yrank
+        self.delta = delta
+        self.r = r
+        self.s = s
+        self.log_base = log_base
+        self.marginal = np.arange(len(xrank), dtype=np.float64)
+
+    @classmethod
+    def from_sample(cls, sample, delta, r, s, log_base):
+        order = np.argsort(sample, axis=0, kind='stable')
+        position = np.empty_like(order)
+        np.put_along_axis(position, order, np.arange(len(sample))[:, None], axis=0)
+        return cls(position[:, 0].copy(), position[:, 1].copy(), delta, r, s, log_base)
+
+    def plane(self, yrank):
+        return Plane(np.column_stack((self.xrank, yrank)).astype(np.float64),
+                     sorted_marginals=(self.marginal, self.marginal), ranks=(self.xrank, yrank))
+
+    def __call__(self, yrank):
+        plane = self.plane(yrank)
+        partition = BatchedAdaptiveAlgorithm(plane.sample, self.delta, self.r, self.s, plane=plane).run()
+        return kl_estimate(plane, partition, log_base=self.log_base)
+
+    def permuted(self, seed):
+        """Estimate of the sample with y shuffled by the permutation given by ``seed``."""
+        return self(self.yrank[np.random.default_rng(seed).permutation(len(self.yrank))])
+
+
+class PermutationResult:
+    """MI estimate of a sample, its permutation null distribution and p-value."""
+
+    def __init__(self, estimate, null, alpha):
+        self.estimate = estimate
+        self.null = null
+        self.alpha = alpha
+
+    @property
+    def n_permutations(self):
+        return len(self.null)
+
+    @property
+    def exceedances(self):
+        return int(np.count_nonzero(self.null >= self.estimate))
+
+    @property
+    def p_value(self):
+        return (self.exceedances + 1) / (self.n_permutations + 1)
+
+    @property
+    def rejected(self):
+        return self.p_value <= self.alpha
+
+    def as_dict(self):
+        return {"estimate": self.estimate, "p_value": self.p_value, "n_permutations": self.n_permutations,
+                "alpha": self.alpha, "rejected": self.rejected}
+
+
+def p_value_decided(exceedances, n_permutations, alpha, level):
+    """Whether the Clopper-Pearson interval of the p-value at ``1 - level`` excludes ``alpha``."""
+    low = beta.ppf(level / 2, exceedances, n_permutations - exceedances + 1) if exceedances > 0 else 0.
+    high = beta.ppf(1 - level / 2, exceedances + 1, n_permutations - exceedances) \
+        if exceedances < n_permutations else 1.
+    return high < alpha or low > alpha
+
+
+_estimator = None
+
+
+def _attach_worker(blocks, delta, r, s, log_base):
+    """Process pool initializer, maps the shared ranks of the parent."""
+    global _estimator
+    _estimator = PermutationEstimator(*attach_arrays(blocks), delta, r, s, log_base)
+
+
+def _worker_permuted(seed):
+    return _estimator.permuted(seed)
+
+
+def permutation_test(sample, delta, r=2, s=2, n_permutations=1000, alpha=0.05, early_stop=True,
+                     batch_size=100, level=1e-3, log_base=np.exp(1), seed=None, workers=None, chunksize=16):
+    """Permutation test of independence based on the adaptive partition MI estimate of ``sample``.
+
+    The sample is ranked once and every permutation of y is estimated in
+    rank space (see ``PermutationEstimator``), with the partition built by
+    ``BatchedAdaptiveAlgorithm``. Permutation ``b`` is drawn from the
+    ``b``-th child of ``seed``, so the null distribution does not depend on
+    ``batch_size`` or ``workers``. Permutations are run by batches of
+    ``batch_size``; with ``early_stop`` the test stops after the first batch
+    at which the p-value is decided, i.e. its Clopper-Pearson interval at
+    confidence ``1 - level`` lies on one side of ``alpha``. With ``workers``
+    the permutations are spread over a process pool that maps the ranks
+    from shared memory.
+    """
+    delta = tabulate_delta(delta, s)
+    estimator = PermutationEstimator.from_sample(np.asarray(sample, dtype=np.float64), delta, r, s, log_base)
+    estimate = estimator(estimator.yrank)
+    seeds = np.random.SeedSequence(seed).spawn(n_permutations)
+
+    def batches(estimate_all):
+        null = np.empty(0)
+        for start in range(0, n_permutations, batch_size):
+            null = np.concatenate([null, estimate_all(seeds[start:start + batch_size])])
+            exceedances = np.count_nonzero(null >= estimate)
+            if early_stop and p_value_decided(exceedances, len(null), alpha, level):
+                break
+
+        return PermutationResult(estimate, null, alpha)
+
+    if workers is None or workers <= 1:
+        return batches(lambda children: np.array([estimator.permuted(child) for child in children]))
+
+    with shared_arrays([estimator.xrank, estimator.yrank]) as blocks:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker,
+                                 initargs=(blocks, delta, r, s, log_base)) as executor:
+            return batches(lambda children: np.array(list(executor.map(_worker_permuted, children,
+                                                                       chunksize=chunksize))))
@@ -0,0 +1,155 @@
+import numpy as np
+
+from streaming import SortedRuns
+
+
+class KLLSketch(SortedRuns):
+    """KLL quantile sketch of a marginal, a mergeable summary of O(1 / error) values.
+
+    Values go into the compactor of level 0. A compactor over its capacity
+    is sorted and every other value, from a random offset, moves up one
+    level with twice the weight. Capacities shrink by 2/3 from the top level
+    down, so the sketch holds about ``3 k`` values whatever the number of
+    values inserted, and ranks are within ``error * n`` of the exact ones
+    with high probability, ``k`` being chosen from ``error`` as in the
+    DataSketches KLL implementation. Sketches of chunks can be merged.
+
+    ``rank``, ``select`` and so ``strip_quantiles`` answer like
+    ``SortedRuns``, approximately.
+    """
+
+    def __init__(self, error=0.01, seed=None):
+        super().__init__()
+        self.error = error
+        self.k = max(int(np.ceil((2.296 / error) ** (1 / 0.9723))), 8)
+        self.rng = np.random.default_rng(seed)
+        self.compactors = [np.empty(0)]
+        self.n = 0
+        self._weighted = None
+
+    def __len__(self):
+        return self.n
+
+    def capacity(self, level):
+        depth = len(self.compactors) - 1 - level
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def insert(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.n += len(values)
+        self.compactors[0] = np.concatenate((self.compactors[0], values))
+        self.compress()
+
+    def merge(self, other):
+        """Add the values summarized by another sketch."""
+        self.n += other.n
+        for level, values in enumerate(other.compactors):
+            if level == len(self.compactors):
+                self.compactors.append(np.empty(0))
+
+            self.compactors[level] = np.concatenate((self.compactors[level], values))
+
+        self.compress()
+
+    def compress(self):
+        level = 0
+        while level < len(self.compactors):
+            values = self.compactors[level]
+            if len(values) > self.capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append(np.empty(0))
+
+                values = np.sort(values)
+                # An odd value out stays, the others compact in pairs
+                keep, values = values[:len(values) % 2], values[len(values) % 2:]
+                self.compactors[level] = keep
+                self.compactors[level + 1] = np.concatenate((self.compactors[level + 1],
+                                                              values[self.rng.integers(2)::2]))
+
+            level += 1
+
+        self._weighted = None
+
+    def weighted(self):
+        """Sorted values of the sketch and their cumulative weights."""
+        if self._weighted is None:
+            values = np.concatenate(self.compactors)
+            weights = np.concatenate([np.full(len(values), 2 ** level) for level, values in enumerate(self.compactors)])
+            order = np.argsort(values, kind='stable')
+            self._weighted = values[order], np.cumsum(weights[order])
+
+        return self._weighted
+
+    def rank(self, values, side='left'):
+        """Approximate number of values below (or up to) each of ``values``."""
+        sorted_values, cumulative = self.weighted()
+        index = np.searchsorted(sorted_values, values, side=side)
+        return np.concatenate(([0], cumulative))[index]
+
+    def select(self, k):
+        """Approximate ``k``-th smallest values (0-based)."""
+        sorted_values, cumulative = self.weighted()
+        return sorted_values[np.minimum(np.searchsorted(cumulative, k, side='right'), len(sorted_values) - 1)]
+
+
+class StripSketches:
+    """KLL sketches of the values of disjoint strips of a marginal, one per strip.
+
+    ``reset`` sets the strips to sketch next, ``add`` gives them the values
+    of a chunk that fall in them and ``finish`` makes them the sketches
+    ``strip_quantiles`` reads, replacing the previous ones. A strip with
+    fewer values than the sketch size ``k`` is summarized exactly. The
+    number of values of every strip ever sketched is kept, see
+    ``strip_sizes``. Sketches share the random generator of ``seed``.
+    """
+
+    def __init__(self, error=0.01, seed=None):
+        self.error = error
+        self.rng = np.random.default_rng(seed)
+        self.sketches = {}
+        self.sizes = {}
+        self.lo = self.hi = np.empty(0)
+        self.pending = []
+
+    def reset(self, lo, hi, splits=None):
+        """Sketch the strips ``[lo, hi)``, or with ``splits`` the parts of each between its split points."""
+        if splits is not None:
+            bounds = np.column_stack((lo, splits, hi))
+            lo, hi = bounds[:, :-1].ravel(), bounds[:, 1:].ravel()
+
+        strips = np.unique(np.column_stack((lo, hi)), axis=0)
+        strips = strips[strips[:, 0] < strips[:, 1]]
+        self.lo, self.hi = np.ascontiguousarray(strips[:, 0]), np.ascontiguousarray(strips[:, 1])
+        self.pending = [KLLSketch(self.error, self.rng) for _ in range(len(strips))]
+
+    def add(self, values):
+        strip = np.searchsorted(self.lo, values, side='right') - 1
+        inside = strip >= 0
+        inside[inside] = values[inside] < self.hi[strip[inside]]
+        strip, values = strip[inside], values[inside]
+
+        order = np.argsort(strip, kind='stable')
+        strip, values = strip[order], values[order]
+        starts = np.flatnonzero(np.diff(strip, prepend=-1))
+        for index, chunk in zip(strip[starts], np.split(values, starts[1:])):
+            self.pending[index].insert(chunk)
+
+    def finish(self):
+        self.sketches = {(lo, hi): sketch for lo, hi, sketch in zip(self.lo, self.hi, self.pending)}
+        self.sizes.update((strip, len(sketch)) for strip, sketch in self.sketches.items())
+        self.pending = []
+
+    def strip_quantiles(self, lo, hi, partition_size):
+        """Approximate lower quantiles of the strips ``[lo, hi)``, as ``SortedRuns.strip_quantiles`` gives them."""
+        strips, inverse = np.unique(np.column_stack((lo, hi)), axis=0, return_inverse=True)
+        quantiles = np.arange(1, partition_size) / partition_size
+        splits = np.empty((len(strips), partition_size - 1))
+        for index, (strip_lo, strip_hi) in enumerate(strips):
+            sketch = self.sketches[strip_lo, strip_hi]
+            splits[index] = sketch.select(np.floor((len(sketch) - 1) * quantiles).astype(np.intp))
+
+        return splits[inverse.ravel()]
+
+    def strip_sizes(self, lo, hi):
+        """Number of values of the strips ``[lo, hi)``, 0 for the empty ones."""
+        return np.array([self.sizes.get(strip, 0) for strip in zip(lo, hi)], dtype=np.int64)
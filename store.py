@@ -0,0 +1,96 @@
+import json
+import os
+
+import numpy as np
+
+from experiments import gaussian_mi
+
+
+class ResultStore:
+    """Append-only JSONL store of experiment replicates.
+
+    Every line records the ``value`` of one ``method`` on replicate ``k`` of
+    the cell ``(rho, n)``, written and flushed as soon as the replicate
+    completes, so an interrupted sweep keeps every completed replicate and
+    a rerun only computes the missing ones. A line cut short by a crash is
+    ignored when the store is loaded; a replicate recorded twice keeps its
+    last value.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.records[self.key(record["rho"], record["n"], record["k"], record["method"])] = record["value"]
+
+    @staticmethod
+    def key(rho, n, k, method):
+        return float(rho), int(n), int(k), str(method)
+
+    def __contains__(self, key):
+        return self.key(*key) in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def done(self, rho, n, k, methods):
+        """Whether every method of the replicate is recorded."""
+        return all((rho, n, k, method) in self for method in methods)
+
+    def record(self, rho, n, k, values):
+        """Append the values of a replicate, given as a dict ``{method: value}``."""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for method, value in values.items():
+                key = self.key(rho, n, k, method)
+                f.write(json.dumps({"rho": key[0], "n": key[1], "k": key[2], "method": key[3], "value": float(value)}) + "\n")
+                self.records[key] = float(value)
+            f.flush()
+
+    def get(self, rho, n, k, method):
+        return self.records[self.key(rho, n, k, method)]
+
+    def cells(self):
+        """Sorted rhos and sample sizes with at least one recorded replicate."""
+        rhos = sorted({key[0] for key in self.records})
+        sample_sizes = sorted({key[1] for key in self.records})
+        return rhos, sample_sizes
+
+    def values(self, methods, rhos=None, sample_sizes=None):
+        """Recorded values as a list, per rho and sample size, of ``(replicates, len(methods))`` arrays.
+
+        Only the replicates with every method recorded are included.
+        """
+        if rhos is None or sample_sizes is None:
+            rhos, sample_sizes = self.cells()
+
+        replicates = {}
+        for rho, n, k, _ in self.records:
+            replicates.setdefault((rho, n), set()).add(k)
+
+        return [[np.array([[self.get(rho, n, k, method) for method in methods]
+                           for k in sorted(replicates.get((float(rho), int(n)), ()))
+                           if self.done(rho, n, k, methods)], dtype=float).reshape(-1, len(methods))
+                 for n in sample_sizes] for rho in rhos]
+
+    def summarize(self, methods, rhos=None, sample_sizes=None, true_mi=gaussian_mi):
+        """Means and standard deviations over the recorded replicates, in the layout of ``table_gen``.
+
+        See ``experiments.summarize``, cells may have different numbers of replicates.
+        """
+        if rhos is None or sample_sizes is None:
+            rhos, sample_sizes = self.cells()
+
+        values = self.values(methods, rhos, sample_sizes)
+        results = {rho: [{n: list(np.mean(values[i][j], axis=0)) for j, n in enumerate(sample_sizes)}, true_mi(rho)]
+                   for i, rho in enumerate(rhos)}
+        results_std = {rho: [{n: list(np.std(values[i][j], axis=0)) for j, n in enumerate(sample_sizes)}, true_mi(rho)]
+                       for i, rho in enumerate(rhos)}
+
+        return results, results_std
@@ -0,0 +1,484 @@
+import numpy as np
+
+from partition import Partition
+
+
+_SIGN = np.uint64(1 << 63)
+
+
+def _float_key(values):
+    """Unsigned integer keys ordered like the float64 ``values``."""
+    bits = np.asarray(values, dtype=np.float64).view(np.uint64)
+    return np.where(bits & _SIGN, ~bits, bits | _SIGN)
+
+
+def _key_float(keys):
+    return np.where(keys & _SIGN, keys ^ _SIGN, ~keys).view(np.float64)
+
+
+class SortedRuns:
+    """Sorted values of a growing sample, kept as a few sorted runs.
+
+    New values form a run of their own, which is merged with the previous
+    run as long as that one is not ``growth`` times larger. Runs shrink
+    geometrically, so there are O(log N) of them and every value is merged
+    O(log N) times: inserting a batch costs O(b log N) amortized, however
+    large the sample already is. Ranks sum one ``searchsorted`` per run.
+    """
+
+    def __init__(self, growth=4):
+        self.growth = growth
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def insert(self, values):
+        run = np.sort(np.asarray(values, dtype=np.float64))
+        while self.runs and len(self.runs[-1]) <= self.growth * len(run):
+            # Concatenated runs are two sorted runs, a stable sort merges them in linear time
+            run = np.sort(np.concatenate([self.runs.pop(), run]), kind='stable')
+
+        self.runs.append(run)
+
+    def rank(self, values, side='left'):
+        """Number of values below (``side='left'``) or up to (``side='right'``) each of ``values``."""
+        return sum(np.searchsorted(run, values, side=side) for run in self.runs)
+
+    def select(self, k):
+        """The ``k``-th smallest values (0-based), for an array of ``k``.
+
+        Bisects the float64 bit patterns between the smallest and largest
+        value for the first one with more than ``k`` values up to it, which
+        takes at most 64 rank evaluations whatever the number of queries.
+        """
+        k = np.asarray(k)
+        if len(self.runs) == 1:
+            return self.runs[0][k]
+
+        lo = np.full(k.shape, _float_key(min(run[0] for run in self.runs)))
+        hi = np.full(k.shape, _float_key(max(run[-1] for run in self.runs)))
+
+        while np.any(lo < hi):
+            mid = lo + (hi - lo) // np.uint64(2)
+            above = self.rank(_key_float(mid), side='right') > k
+            hi = np.where(above, mid, hi)
+            lo = np.where(above, lo, mid + np.uint64(1))
+
+        return _key_float(lo)
+
+    def strip_quantiles(self, lo, hi, partition_size):
+        """Lower quantiles ``j / partition_size`` of the values inside every strip ``[lo, hi)``.
+
+        Same as ``Plane.strip_quantiles`` for arrays of strips, returns an
+        array of shape ``(len(lo), partition_size - 1)``.
+        """
+        lo_rank, hi_rank = self.rank(lo), self.rank(hi)
+        quantiles = np.arange(1, partition_size) / partition_size
+        k = lo_rank[:, None] + np.floor((hi_rank - lo_rank - 1)[:, None] * quantiles).astype(np.intp)
+        return self.select(k.ravel()).reshape(k.shape)
+
+
+class SortedArray(SortedRuns):
+    """Sorted values of a sample of bounded size, in a single array.
+
+    Values are inserted and removed in place, which moves the array once
+    per batch but keeps ranks and quantiles to one lookup; suited to a
+    sliding window, whose size does not grow.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.runs = [np.empty(0)]
+
+    def insert(self, values):
+        values = np.sort(np.asarray(values, dtype=np.float64))
+        self.runs[0] = np.insert(self.runs[0], np.searchsorted(self.runs[0], values, side='left'), values)
+
+    def remove(self, values):
+        """Remove values, which must be present."""
+        values = np.sort(np.asarray(values, dtype=np.float64))
+        # Position of every value: its first occurrence plus its rank among the equal removed values
+        first = np.searchsorted(values, values, side='left')
+        position = np.searchsorted(self.runs[0], values, side='left') + np.arange(len(values)) - first
+        self.runs[0] = np.delete(self.runs[0], position)
+
+
+class StreamingAdaptiveEstimator:
+    """Adaptive partition MI estimate of a sample that grows by batches.
+
+    The first batch is partitioned as ``BatchedAdaptiveAlgorithm`` would
+    (the estimate is the same), except that the outer cells extend to
+    infinity so that later points always fall inside the partition. Every
+    later batch is routed down the tree of splits into the existing leaves,
+    and the chi-square split test is run again only on the leaves that
+    received points, splitting them further if it now passes; cells are
+    never merged. Quantiles and marginal counts come from ``SortedRuns`` of
+    all the points seen so far.
+
+    The estimate is kept as ``log N + T / N`` with ``T`` the sum over leaves
+    of ``n log(n / (n_x n_y))``, and ``T`` is updated with the terms of the
+    leaves whose joint or marginal counts changed. Apart from one vectorized
+    pass over the leaf limits to find them, the cost of a batch depends on
+    its size and on the leaves it touches, not on the number of points seen.
+    """
+
+    marginal_type = SortedRuns
+
+    def __init__(self, delta, r, s, log_base=np.exp(1)):
+        self.delta = delta
+        self.r = r
+        self.s = s
+        self.log_base = log_base
+        self.thresholds = {val: delta(val) for val in [s, s ** 2]}
+
+        self.x = self.marginal_type()
+        self.y = self.marginal_type()
+        self.n_samples = 0
+        self.n_seen = 0
+        self.total = 0.
+
+        # Nodes of the tree of splits, in arrays grown by doubling. Internal
+        # nodes have r ** 2 consecutive children from ``child``, leaves -1
+        # and nodes removed by a merge -2
+        self.n_nodes = 0
+        self.xlo, self.xhi, self.ylo, self.yhi = [np.empty(0) for _ in range(4)]
+        self.xsplits, self.ysplits = np.empty((0, r - 1)), np.empty((0, r - 1))
+        self.counts, self.x_counts, self.y_counts = [np.empty(0, dtype=np.int64) for _ in range(3)]
+        self.child, self.parent = np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        self.terms = np.empty(0)
+        # Points of every leaf, as a list of (n, 3) arrays of x, y and arrival number
+        self.members = {}
+        # Nodes that stopped and started being leaves since the last update of the estimate
+        self.ended, self.started = [], []
+
+    def add_nodes(self, xlo, xhi, ylo, yhi, counts, parent=-1):
+        """Append leaves with the given limits and counts, returns their ids."""
+        n_new = len(xlo)
+        size = self.n_nodes + n_new
+        if size > len(self.child):
+            capacity = max(2 * len(self.child), size, 16)
+            for name in ['xlo', 'xhi', 'ylo', 'yhi', 'xsplits', 'ysplits', 'counts', 'x_counts', 'y_counts', 'child',
+                         'parent', 'terms']:
+                array = getattr(self, name)
+                grown = np.zeros((capacity, *array.shape[1:]), dtype=array.dtype)
+                grown[:self.n_nodes] = array[:self.n_nodes]
+                setattr(self, name, grown)
+
+        ids = np.arange(self.n_nodes, size)
+        for array, values in zip([self.xlo, self.xhi, self.ylo, self.yhi, self.counts], [xlo, xhi, ylo, yhi, counts]):
+            array[ids] = values
+
+        self.child[ids] = -1
+        self.parent[ids] = parent
+        self.x_counts[ids] = self.y_counts[ids] = 0
+        self.terms[ids] = 0.
+        self.n_nodes = size
+
+        return ids
+
+    def split_nodes(self, nodes, xsplits, ysplits, points, cell, child):
+        """Split leaves into ``r ** 2`` children along the given split points.
+
+        ``points`` are the points of the leaves, ``cell`` the position in
+        ``nodes`` of the leaf of every point and ``child`` its child. Returns
+        the ids of the children.
+        """
+        n_children = self.r ** 2
+        xpart = np.concatenate([self.xlo[nodes, None], xsplits, self.xhi[nodes, None]], axis=1)
+        ypart = np.concatenate([self.ylo[nodes, None], ysplits, self.yhi[nodes, None]], axis=1)
+        ix, iy = np.divmod(np.arange(n_children), self.r)
+
+        key = cell * n_children + child
+        child_n = np.bincount(key, minlength=len(nodes) * n_children)
+        ids = self.add_nodes(xpart[:, ix].ravel(), xpart[:, ix + 1].ravel(), ypart[:, iy].ravel(),
+                             ypart[:, iy + 1].ravel(), child_n, np.repeat(nodes, n_children))
+
+        self.child[nodes] = ids[::n_children]
+        self.ended.append(nodes)
+        self.started.append(ids)
+        self.xsplits[nodes], self.ysplits[nodes] = xsplits, ysplits
+
+        order = np.argsort(key, kind='stable')
+        for node, chunk in zip(ids, np.split(points[order], np.cumsum(child_n)[:-1])):
+            self.members[node] = [chunk]
+
+        for node in nodes:
+            del self.members[node]
+
+        return ids
+
+    def locate(self, points):
+        """Leaf of every point, by descending the tree of splits."""
+        node = np.zeros(len(points), dtype=np.intp)
+        active = np.flatnonzero(self.child[node] >= 0)
+        while len(active) > 0:
+            current = node[active]
+            xbin = np.sum(self.xsplits[current] <= points[active, 0, None], axis=1)
+            ybin = np.sum(self.ysplits[current] <= points[active, 1, None], axis=1)
+            node[active] = self.child[current] + xbin * self.r + ybin
+            active = active[self.child[node[active]] >= 0]
+
+        return node
+
+    def level_bins(self, nodes, points, cell):
+        """Split points and bins of the points of ``nodes`` on the s, s ** 2 and r grids."""
+        bins = {}
+        finest = self.s ** 2
+        for val in [finest, self.s, self.r]:
+            if val in bins:
+                continue
+
+            if val != finest and finest % val == 0:
+                xsplits, ysplits, xbin, ybin = bins[finest]
+                k = finest // val
+                bins[val] = xsplits[:, k - 1::k], ysplits[:, k - 1::k], xbin // k, ybin // k
+
+            else:
+                xsplits = self.x.strip_quantiles(self.xlo[nodes], self.xhi[nodes], val)
+                ysplits = self.y.strip_quantiles(self.ylo[nodes], self.yhi[nodes], val)
+                xbin = np.sum(xsplits[cell] <= points[:, 0, None], axis=1)
+                ybin = np.sum(ysplits[cell] <= points[:, 1, None], axis=1)
+                bins[val] = xsplits, ysplits, xbin, ybin
+
+        return bins
+
+    def split_test(self, nodes):
+        """Chi-square split test of leaves, on the s and s ** 2 grids.
+
+        Returns whether each leaf passes, the points of every leaf, all of
+        them concatenated with the position in ``nodes`` of their leaf, and
+        their bins (see ``level_bins``).
+        """
+        chunks = [np.concatenate(self.members[node]) for node in nodes]
+        points = np.concatenate(chunks)
+        n_samples = np.array([len(chunk) for chunk in chunks])
+        cell = np.repeat(np.arange(len(nodes)), n_samples)
+
+        bins = self.level_bins(nodes, points, cell)
+        passed = np.zeros(len(nodes), dtype=bool)
+        for val in [self.s, self.s ** 2]:
+            e_val = n_samples / (val ** 2)
+            _, _, xbin, ybin = bins[val]
+            num_samples_child = np.bincount(cell * val ** 2 + xbin * val + ybin,
+                                            minlength=len(nodes) * val ** 2).reshape(len(nodes), val ** 2)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                estimate = np.sum(np.square(num_samples_child - e_val[:, None]), axis=1) / e_val
+
+            passed |= (n_samples > 2) & (estimate >= self.thresholds[val])
+
+        return passed, chunks, points, cell, bins
+
+    def refine(self, frontier):
+        """Test the leaves of ``frontier`` and split them, level by level, as long as tests pass."""
+        while len(frontier) > 0:
+            split, chunks, points, cell, bins = self.split_test(frontier)
+
+            for i in np.flatnonzero(~split):
+                self.members[frontier[i]] = [chunks[i]]
+
+            xsplits, ysplits, xbin, ybin = bins[self.r]
+            inside = split[cell]
+            position = np.cumsum(split) - 1
+            children = self.split_nodes(frontier[split], xsplits[split], ysplits[split], points[inside],
+                                        position[cell[inside]], xbin[inside] * self.r + ybin[inside])
+            frontier = children[self.counts[children] > 2]
+
+    def insert(self, batch):
+        """Add points to the marginals and to their leaves, returns the leaves that received points."""
+        self.x.insert(batch[:, 0])
+        self.y.insert(batch[:, 1])
+        # Points are stored with their arrival number
+        batch = np.column_stack([batch, np.arange(self.n_seen, self.n_seen + len(batch))])
+        self.n_samples += len(batch)
+        self.n_seen += len(batch)
+
+        if self.n_nodes == 0:
+            # Initial equiprobable r x r partition of the first batch, without test
+            root = self.add_nodes([-np.inf], [np.inf], [-np.inf], [np.inf], [len(batch)])
+            quantiles = np.arange(1, self.r) / self.r
+            xsplits = np.quantile(batch[:, 0], quantiles)[None]
+            ysplits = np.quantile(batch[:, 1], quantiles)[None]
+            xbin = np.searchsorted(xsplits[0], batch[:, 0], side='right')
+            ybin = np.searchsorted(ysplits[0], batch[:, 1], side='right')
+            self.members[root[0]] = []
+            return self.split_nodes(root, xsplits, ysplits, batch, np.zeros(len(batch), dtype=np.intp),
+                                    xbin * self.r + ybin)
+
+        leaf = self.locate(batch)
+        order = np.argsort(leaf, kind='stable')
+        touched, starts, added = np.unique(leaf[order], return_index=True, return_counts=True)
+        for node, chunk in zip(touched, np.split(batch[order], starts[1:])):
+            self.members[node].append(chunk)
+
+        self.counts[touched] += added
+        return touched
+
+    def update_terms(self, added, removed=None):
+        """Update the sum of the estimate after points were added and removed.
+
+        Leaves that stopped being leaves are taken out of the sum, leaves
+        created since the last update get their marginal counts from the
+        sorted marginals, and the other leaves have them updated with the
+        points of the strips.
+        """
+        ended = np.concatenate([np.empty(0, dtype=np.intp), *self.ended])
+        self.total -= np.sum(self.terms[ended])
+        self.terms[ended] = 0.
+
+        leaves = np.flatnonzero(self.child[:self.n_nodes] == -1)
+        fresh = np.zeros(self.n_nodes, dtype=bool)
+        fresh[np.concatenate([np.empty(0, dtype=np.intp), *self.started])] = True
+        fresh = fresh[leaves]
+        self.ended, self.started = [], []
+
+        # Marginal counts change for the leaves whose strips received or lost points
+        # Points may enter and leave a strip, leaving its count unchanged, the leaf still changed
+        moved, changed = [], fresh.copy()
+        for lo, hi, axis in [(self.xlo, self.xhi, 0), (self.ylo, self.yhi, 1)]:
+            moved.append(np.zeros(len(leaves), dtype=np.int64))
+            for points, sign in [(added, 1), (removed, -1)]:
+                if points is not None and len(points) > 0:
+                    marg = np.sort(points[:, axis])
+                    in_strip = np.searchsorted(marg, hi[leaves], side='left') - np.searchsorted(marg, lo[leaves], side='left')
+                    moved[-1] += sign * in_strip
+                    changed |= in_strip > 0
+
+        x_moved, y_moved = moved
+        self.x_counts[leaves[~fresh]] += x_moved[~fresh]
+        self.y_counts[leaves[~fresh]] += y_moved[~fresh]
+
+        new = leaves[fresh]
+        self.x_counts[new] = self.x.rank(self.xhi[new]) - self.x.rank(self.xlo[new])
+        self.y_counts[new] = self.y.rank(self.yhi[new]) - self.y.rank(self.ylo[new])
+
+        changed = leaves[changed]
+        n, n_x, n_y = self.counts[changed].astype(float), self.x_counts[changed], self.y_counts[changed]
+        terms = np.zeros(len(changed))
+        nonempty = n > 0
+        terms[nonempty] = n[nonempty] * (np.log(n[nonempty]) - np.log(n_x[nonempty]) - np.log(n_y[nonempty]))
+        self.total += np.sum(terms) - np.sum(self.terms[changed])
+        self.terms[changed] = terms
+
+    def update(self, batch):
+        """Add a batch of (n, 2) points and return the updated MI estimate."""
+        batch = np.asarray(batch, dtype=np.float64).reshape(-1, 2)
+        if len(batch) == 0:
+            return self.estimate()
+
+        touched = self.insert(batch)
+        self.refine(touched[self.counts[touched] > 2])
+        self.update_terms(batch)
+
+        return self.estimate()
+
+    def estimate(self):
+        """Current MI estimate, the plug-in estimate of ``kl_estimate`` on the current partition."""
+        if self.n_samples == 0:
+            return 0.
+
+        return (np.log(self.n_samples) + self.total / self.n_samples) / np.log(self.log_base)
+
+    def partition(self):
+        """Current leaves as a ``Partition``, the outer cells extend to infinity."""
+        leaves = np.flatnonzero(self.child[:self.n_nodes] == -1)
+        return Partition(self.xlo[leaves], self.xhi[leaves], self.ylo[leaves], self.yhi[leaves], self.counts[leaves])
+
+
+class SlidingWindowEstimator(StreamingAdaptiveEstimator):
+    """Adaptive partition MI estimate over a sliding window of a series of pairs.
+
+    The first ``window`` points are partitioned as by
+    ``StreamingAdaptiveEstimator``. Every ``step`` points the window slides:
+    new points are routed into their leaves and the oldest ones are removed
+    from theirs and from the sorted marginals. Parents of leaves that lost
+    points are tested again and their children merged back when the split
+    test no longer passes, then leaves that changed are tested for a split.
+    The initial r x r grid is kept.
+    """
+
+    marginal_type = SortedArray
+
+    def __init__(self, delta, r, s, window, step, log_base=np.exp(1)):
+        if step > window:
+            raise ValueError("step must not be larger than window")
+
+        super().__init__(delta, r, s, log_base=log_base)
+        self.window = window
+        self.step = step
+        self.n_expired = 0
+
+    def expire(self, batch):
+        """Remove the oldest points of the window, returns the leaves they were in."""
+        self.x.remove(batch[:, 0])
+        self.y.remove(batch[:, 1])
+        self.n_samples -= len(batch)
+        self.n_expired += len(batch)
+
+        touched, removed = np.unique(self.locate(batch), return_counts=True)
+        for node in touched:
+            points = np.concatenate(self.members[node])
+            self.members[node] = [points[points[:, 2] >= self.n_expired]]
+
+        self.counts[touched] -= removed
+        return touched
+
+    def coarsen(self, nodes):
+        """Merge the children of the parents of ``nodes`` back into their parent when it no longer passes the test.
+
+        Only parents whose children are all leaves are merged, moving up the
+        tree as long as merges happen. The initial r x r grid is never merged.
+        """
+        n_children = self.r ** 2
+        parents = np.unique(self.parent[nodes])
+        while True:
+            parents = parents[parents > 0]
+            children = self.child[parents, None] + np.arange(n_children)
+            mergeable = np.all(self.child[children] == -1, axis=1)
+            parents, children = parents[mergeable], children[mergeable]
+            if len(parents) == 0:
+                break
+
+            for parent, kids in zip(parents, children):
+                self.members[parent] = [chunk for kid in kids for chunk in self.members[kid]]
+
+            passed, chunks, _, _, _ = self.split_test(parents)
+            for i, parent in enumerate(parents):
+                if passed[i]:
+                    del self.members[parent]
+                    continue
+
+                for kid in children[i]:
+                    del self.members[kid]
+
+                self.members[parent] = [chunks[i]]
+                self.counts[parent] = len(chunks[i])
+
+            merged = parents[~passed]
+            self.child[children[~passed]] = -2
+            self.child[merged] = -1
+            self.ended.append(children[~passed].ravel())
+            self.started.append(merged)
+
+            parents = np.unique(self.parent[merged])
+
+    def slide(self, new, old):
+        """Add the ``new`` points, remove the ``old`` ones and return the updated MI estimate."""
+        added = self.insert(new)
+        removed = self.expire(old)
+        self.coarsen(removed)
+
+        touched = np.union1d(added, removed)
+        touched = touched[(self.child[touched] == -1) & (self.counts[touched] > 2)]
+        self.refine(touched)
+        self.update_terms(new, old)
+
+        return self.estimate()
+
+    def run(self, data):
+        """Generator of the MI estimate of every window of the (N, 2) ``data``, one per step."""
+        data = np.asarray(data, dtype=np.float64).reshape(-1, 2)
+        yield self.update(data[:self.window])
+
+        for end in range(self.window + self.step, len(data) + 1, self.step):
+            yield self.slide(data[end - self.step:end], data[end - self.step - self.window:end - self.window])
@@ -0,0 +1,75 @@
+import numpy as np
+
+from divergence_utils import kl_estimate
+from partition import BatchedAdaptiveAlgorithm, Plane, tabulate_delta
+
+
+class SweptAdaptiveAlgorithm(BatchedAdaptiveAlgorithm):
+    """Batched adaptive algorithm whose initial partition points are given."""
+
+    def __init__(self, sample, delta, r, s, splits, plane=None):
+        super().__init__(sample, delta, r, s, plane)
+        self.splits = splits
+
+    def initial_splits(self):
+        return self.splits
+
+
+class ConfigurationSweep:
+    """Adaptive partition MI estimates of a sample for several ``(r, s, delta)`` configurations.
+
+    The work common to the configurations is done once per sample: the
+    plane, with its sorted marginals and ranks, is shared by all of them and
+    the initial quantiles of every ``r`` come out of a single ``np.quantile``
+    call. ``delta`` is tabulated once per ``(delta, s)`` when the sweep is
+    built, and repeated configurations are estimated once. Calling the sweep
+    on a sample gives one MI per configuration, in order, so it can be used
+    as a method of ``experiments.run_replicates``.
+    """
+
+    def __init__(self, configs, log_base=np.exp(1)):
+        thresholds = {}
+        for r, s, delta in configs:
+            if (delta, s) not in thresholds:
+                thresholds[delta, s] = tabulate_delta(delta, s)
+
+        self.configs = [(r, s, thresholds[delta, s]) for r, s, delta in configs]
+        self.log_base = log_base
+
+        # Every configuration points to the first identical one
+        self.unique = []
+        self.slot = []
+        for r, s, delta in configs:
+            key = (r, s, delta)
+            if key not in self.unique:
+                self.unique.append(key)
+            self.slot.append(self.unique.index(key))
+
+        self.quantiles = np.unique(np.concatenate([np.arange(1, r) / r for r, _, _ in configs]))
+
+    def initial_splits(self, sample):
+        """Inner partition points of the initial partition of every ``r``, from one quantile table."""
+        table = np.quantile(sample, self.quantiles, axis=0)
+        splits = {}
+        for r, _, _ in self.configs:
+            rows = np.searchsorted(self.quantiles, np.arange(1, r) / r)
+            splits[r] = (table[rows, 0], table[rows, 1])
+
+        return splits
+
+    def __call__(self, sample):
+        plane = Plane(sample)
+        splits = self.initial_splits(sample)
+
+        estimates = []
+        for i in range(len(self.unique)):
+            r, s, delta = self.configs[self.slot.index(i)]
+            partition = SweptAdaptiveAlgorithm(sample, delta, r, s, splits[r], plane=plane).run()
+            estimates.append(kl_estimate(plane, partition, log_base=self.log_base))
+
+        return [estimates[slot] for slot in self.slot]
+
+
+def sweep(sample, configs, log_base=np.exp(1)):
+    """MI estimate of ``sample`` for every ``(r, s, delta)`` configuration, see ``ConfigurationSweep``."""
+    return np.array(ConfigurationSweep(configs, log_base=log_base)(np.asarray(sample, dtype=np.float64)))
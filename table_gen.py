@@ -82,7 +82,16 @@ TIME_TABLE = r"""
 \end{table*}
 """
 
-def generate_table(results):
+def as_results(results, methods):
+    """Means in the layout of ``generate_table``, from a dict of results or a ``store.ResultStore``."""
+    if hasattr(results, "summarize"):
+        return results.summarize(methods)[0]
+
+    return results
+
+
+def generate_table(results, methods=("ML", "CI", "NA")):
+    results = as_results(results, methods)
     format_list = []
     prec_format = "{:.4f}"
     for sample_dict, real_mi in results.values():
@@ -96,7 +105,8 @@ def generate_table(results):
         f.write(TABLE % tuple(format_list))
 
 
-def generate_rs_table(results):
+def generate_rs_table(results, methods=("r=s=2", "r=s=4", "r=s=5", "r=s=10")):
+    results = as_results(results, methods)
     format_list = []
     prec_format = "{:.4f}"
     for sample_dict, real_mi in results.values():
@@ -111,7 +121,8 @@ def generate_rs_table(results):
         f.write(RS_TABLE % tuple(format_list))
 
 
-def generate_timing_table(results):
+def generate_timing_table(results, methods=("ML", "CI", "NA")):
+    results = as_results(results, methods)
     format_list = []
     prec_format = "{:.4f}"
     for sample_dict, _ in results.values():
@@ -0,0 +1,48 @@
+import unittest
+
+import numpy as np
+from scipy.stats import chi2
+
+from bootstrap import ResampleEstimator, bootstrap
+from divergence_utils import kl_estimate
+from partition import AdaptiveAlgorithm, Plane, tabulate_delta
+
+
+def delta(x):
+    return chi2.ppf(0.97, x ** 2 - 1)
+
+
+class TestBootstrap(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(6)
+        self.sample = rng.multivariate_normal([0, 0], [[1, 0.6], [0.6, 1]], size=800)
+
+    def test_subsample(self):
+        estimator = ResampleEstimator.from_sample(self.sample, tabulate_delta(delta, 2), 2, 2, np.exp(1))
+        keep = np.random.RandomState(1).random_sample(len(self.sample)) < 0.5
+        for mask in [np.ones(len(self.sample), dtype=bool), keep]:
+            sample = self.sample[mask]
+            expected = kl_estimate(Plane(sample), AdaptiveAlgorithm(sample, delta, 2, 2).run())
+            self.assertAlmostEqual(estimator(mask), expected)
+
+    def test_interval(self):
+        for method in ['percentile', 'bca']:
+            result = bootstrap(self.sample, delta, n_resamples=100, method=method, jackknife_groups=20, seed=3)
+            self.assertEqual(result.replicates.shape, (100,))
+            self.assertLess(result.interval[0], result.estimate)
+            self.assertLess(result.estimate, result.interval[1])
+
+        with self.assertRaises(ValueError):
+            bootstrap(self.sample, delta, method='basic')
+
+    def test_workers(self):
+        serial = bootstrap(self.sample, delta, n_resamples=40, method='bca', jackknife_groups=10, seed=2)
+        parallel = bootstrap(self.sample, delta, n_resamples=40, method='bca', jackknife_groups=10, seed=2,
+                             workers=2, chunksize=4)
+        np.testing.assert_array_equal(serial.replicates, parallel.replicates)
+        self.assertEqual(serial.interval, parallel.interval)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.stats import chi2
+
+from cache import PartitionCache
+from experiments import AdaptiveEstimator, NonAdaptiveEstimator
+from partition import GridPartition
+
+
+def delta(x):
+    return chi2.ppf(0.97, x ** 2 - 1)
+
+
+class TestPartitionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        rng = np.random.RandomState(10)
+        self.samples = [rng.multivariate_normal([0, 0], [[1, 0.5], [0.5, 1]], size=500) for _ in range(3)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_estimators(self):
+        cache = PartitionCache(self.directory.name)
+        methods = [AdaptiveEstimator(delta, 2, 2, cache=cache), NonAdaptiveEstimator(bins=[5, 5], cache=cache)]
+        uncached = [AdaptiveEstimator(delta, 2, 2), NonAdaptiveEstimator(bins=[5, 5])]
+
+        first = [method(sample) for sample in self.samples for method in methods]
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 6, 6))
+        second = [method(sample) for sample in self.samples for method in methods]
+        self.assertEqual((cache.hits, cache.misses), (6, 6))
+        self.assertEqual(first, second)
+        self.assertEqual(first, [method(sample) for sample in self.samples for method in uncached])
+
+        # Other parameters are other entries
+        AdaptiveEstimator(delta, 4, 4, cache=cache)(self.samples[0])
+        self.assertEqual((cache.misses, len(cache)), (7, 7))
+
+    def test_roundtrip(self):
+        cache = PartitionCache(self.directory.name)
+        partition, estimate = NonAdaptiveEstimator(bins=[4, 3]).fit(self.samples[0])
+        key = cache.key(self.samples[0], bins=[4, 3])
+        cache.put(key, partition, estimate)
+
+        cached, cached_estimate = cache.get(key)
+        self.assertIsInstance(cached, GridPartition)
+        np.testing.assert_array_equal(cached.grid, partition.grid)
+        self.assertEqual(cached_estimate, estimate)
+
+        partition, estimate = AdaptiveEstimator(delta, 2, 2).fit(self.samples[0])
+        cache.put(key, partition, estimate)
+        cached, _ = cache.get(key)
+        np.testing.assert_array_equal(cached.counts, partition.counts)
+        np.testing.assert_array_equal(cached.parent, partition.parent)
+
+    def test_eviction(self):
+        cache = PartitionCache(self.directory.name)
+        method = AdaptiveEstimator(delta, 2, 2, cache=cache)
+        method(self.samples[0])
+        entry_size = cache.size
+
+        cache.max_bytes = 2 * entry_size + entry_size // 2
+        keys = [cache.key(sample, method="adaptive", engine="BatchedAdaptiveAlgorithm", r=2, s=2,
+                          delta=[delta(2), delta(4)]) for sample in self.samples]
+        os.utime(cache.path(keys[0]), (0, 0))
+        method(self.samples[1])
+        os.utime(cache.path(keys[1]), (1, 1))
+        # Hitting the first entry leaves the second as the least recently used
+        method(self.samples[0])
+        method(self.samples[2])
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
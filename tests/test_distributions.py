@@ -1,8 +1,10 @@
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
-from distributions import Distribution, Uniform
+from distributions import (BivariatePareto, Distribution, Joint, MultivariateNormal, RandomVar, Uniform,
+                           sample_replicates)
 
 
 class TestDistribution(unittest.TestCase):
@@ -59,3 +61,49 @@ class TestDistribution(unittest.TestCase):
         ground_truth = cube(u1.sample(10))
         self.seed()
         np.testing.assert_almost_equal(m1.sample(10), ground_truth)
+
+    def test_joint(self):
+        u = RandomVar(Uniform(0, 1))
+        xy = Joint(u, RandomVar.operation(u, np.square))
+        first, second = xy.sample(10), xy.sample(10)
+        self.assertEqual(first.shape, (10, 2))
+        np.testing.assert_almost_equal(first[:, 1], np.square(first[:, 0]))
+        self.assertFalse(np.array_equal(first, second))
+
+        batch = xy.sample_batch(3, 10)
+        self.assertEqual(batch.shape, (3, 10, 2))
+        np.testing.assert_almost_equal(batch[..., 1], np.square(batch[..., 0]))
+
+    def test_sample_batch(self):
+        self.assertEqual(Uniform(1, 2).sample_batch(4, 10).shape, (4, 10))
+        self.assertEqual(BivariatePareto(5, 2, 3).sample(10).shape, (10, 2))
+
+        dist = MultivariateNormal(np.zeros(2), np.eye(2))
+        self.seed()
+        ground_truth = dist.sample(40)
+        self.seed()
+        np.testing.assert_array_equal(dist.sample_batch(4, 10), ground_truth.reshape(4, 10, 2))
+
+    def test_generator(self):
+        u = RandomVar(Uniform(0, 1))
+        xy = Joint(u, RandomVar.operation(u, np.square))
+        np.testing.assert_array_equal(xy.sample(10, np.random.default_rng(3)), xy.sample(10, np.random.default_rng(3)))
+        np.testing.assert_array_equal(xy.sample(10, rng=5), xy.sample(10, rng=np.random.default_rng(5)))
+
+        # Every draw of the sum is independent outside a joint sample
+        s = Distribution.sum(u.dist, u.dist)
+        self.assertFalse(np.allclose(s.sample(10, rng=1), 2 * Uniform(0, 1).sample(10, rng=1)))
+
+    def test_threads(self):
+        u = RandomVar(Uniform(0, 1))
+        xy = Joint(u, RandomVar.operation(u, np.square))
+        replicates = sample_replicates(xy, 8, 1000, seed=2, workers=4)
+        self.assertEqual(replicates.shape, (8, 1000, 2))
+        np.testing.assert_array_equal(replicates, sample_replicates(xy, 8, 1000, seed=2, workers=1))
+        np.testing.assert_almost_equal(replicates[..., 1], np.square(replicates[..., 0]))
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            samples = list(executor.map(lambda n: xy.sample(n, rng=n), [500, 1000, 1500, 2000] * 4))
+
+        for sample in samples:
+            np.testing.assert_almost_equal(sample[:, 1], np.square(sample[:, 0]))
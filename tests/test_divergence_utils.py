@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+
+from divergence_utils import kl_estimate, kl_estimate_arrays
+from partition import HistogramPartition, NonAdaptivePartition, Plane
+
+
+def reference_kl_estimate(plane, rectangles):
+    N = plane.sample.shape[0]
+    mi_estimate = 0
+    for rect in rectangles:
+        joint_n = len(plane.get_samples(rect.xlim, rect.ylim))
+        if joint_n == 0:
+            continue
+        x_marg_n = len(plane.get_samples(rect.xlim, plane.ylim))
+        y_marg_n = len(plane.get_samples(plane.xlim, rect.ylim))
+        mi_estimate += joint_n * np.log(N * joint_n / (x_marg_n * y_marg_n))
+
+    return mi_estimate / N
+
+
+class TestKLEstimate(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(4)
+        self.sample = rng.multivariate_normal(np.zeros(2), [[1., 0.8], [0.8, 1.]], size=2000)
+        self.plane = Plane(self.sample)
+        self.partition = NonAdaptivePartition(self.sample, bins=[12, 9]).run()
+
+    def test_kl_estimate(self):
+        self.assertAlmostEqual(kl_estimate(self.plane, self.partition),
+                               reference_kl_estimate(self.plane, self.partition))
+
+    def test_log_base(self):
+        self.assertAlmostEqual(kl_estimate(self.plane, self.partition, log_base=2),
+                               reference_kl_estimate(self.plane, self.partition) / np.log(2))
+
+    def test_kl_estimate_arrays(self):
+        xlo, xhi, ylo, yhi = np.array([[*rect.xlim, *rect.ylim] for rect in self.partition]).T
+        joint_n = self.plane.count_many(xlo, xhi, ylo, yhi)
+        self.assertAlmostEqual(kl_estimate_arrays(self.plane, xlo, xhi, ylo, yhi, joint_n),
+                               reference_kl_estimate(self.plane, self.partition))
+
+    def test_kl_estimate_grid(self):
+        grid = HistogramPartition(self.sample, bins=[12, 9]).run()
+        self.assertAlmostEqual(kl_estimate(self.plane, grid), reference_kl_estimate(self.plane, self.partition))
+
+
+if __name__ == "__main__":
+    unittest.main()
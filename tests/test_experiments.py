@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+from scipy.stats import chi2
+
+from experiments import AdaptiveEstimator, MLEstimator, NonAdaptiveEstimator, run_replicates, summarize
+from sweep import ConfigurationSweep
+
+
+class TestExperiments(unittest.TestCase):
+
+    def setUp(self):
+        delta = lambda x: chi2.ppf(0.97, x ** 2 - 1)
+        self.methods = [MLEstimator(), AdaptiveEstimator(delta, 2, 2), NonAdaptiveEstimator(bins=[5, 5])]
+        self.rhos = [0., 0.6]
+        self.sample_sizes = [100, 300]
+
+    def test_reproducible(self):
+        serial = run_replicates(self.methods, self.rhos, self.sample_sizes, 3, seed=7)
+        parallel = run_replicates(self.methods, self.rhos, self.sample_sizes, 3, seed=7, workers=2, chunksize=1)
+        self.assertEqual(serial.shape, (2, 2, 3, 3))
+        np.testing.assert_array_equal(serial, parallel)
+        self.assertFalse(np.array_equal(serial, run_replicates(self.methods, self.rhos, self.sample_sizes, 3, seed=8)))
+
+    def test_global_state(self):
+        np.random.seed(3)
+        expected = np.random.random()
+        np.random.seed(3)
+        run_replicates(self.methods[:1], self.rhos, self.sample_sizes, 1)
+        self.assertEqual(np.random.random(), expected)
+
+    def test_sweep(self):
+        delta = lambda x: chi2.ppf(0.97, x ** 2 - 1)
+        methods = [MLEstimator(), ConfigurationSweep([(rs, rs, delta) for rs in [2, 4]])]
+        values = run_replicates(methods, self.rhos, self.sample_sizes, 2, seed=1)
+        expected = run_replicates([MLEstimator(), AdaptiveEstimator(delta, 2, 2), AdaptiveEstimator(delta, 4, 4)],
+                                  self.rhos, self.sample_sizes, 2, seed=1)
+        self.assertEqual(values.shape, (2, 2, 2, 3))
+        np.testing.assert_allclose(values, expected)
+
+    def test_summarize(self):
+        values = run_replicates(self.methods, self.rhos, self.sample_sizes, 4)
+        results, results_std = summarize(values, self.rhos, self.sample_sizes)
+        self.assertEqual(set(results), set(self.rhos))
+        self.assertAlmostEqual(results[0.6][1], - np.log(1 - 0.36) / 2)
+        self.assertEqual(len(results[0.][0][300]), 3)
+        self.assertAlmostEqual(results_std[0.6][0][100][1], np.std(values[1, 0, :, 1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import io
+import unittest
+
+import numpy as np
+from scipy.stats import chi2
+
+from divergence_utils import kl_estimate
+from fitted import FittedPartition
+from partition import HistogramPartition, Plane
+
+
+def delta(x):
+    return chi2.ppf(0.97, x ** 2 - 1)
+
+
+class TestFittedPartition(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(11)
+        self.sample = rng.multivariate_normal([0, 0], [[1, 0.6], [0.6, 1]], size=3000)
+        self.points = rng.multivariate_normal([0, 0], [[1, 0.6], [0.6, 1]], size=5000) * 1.2
+
+    def check_assign(self, fitted):
+        p = fitted.partition
+        cell = fitted.assign(self.points)
+        inside = ((self.points[:, 0, None] >= p.xlo) & (self.points[:, 0, None] < p.xhi) &
+                  (self.points[:, 1, None] >= p.ylo) & (self.points[:, 1, None] < p.yhi))
+        np.testing.assert_array_equal(inside.sum(axis=1), (cell >= 0).astype(int))
+        np.testing.assert_array_equal(np.argmax(inside, axis=1)[cell >= 0], cell[cell >= 0])
+
+    def test_assign(self):
+        fitted = FittedPartition.fit(self.sample, delta, 2, 2)
+        self.check_assign(fitted)
+        np.testing.assert_array_equal(fitted.counts(self.sample), fitted.partition.counts)
+        self.check_assign(FittedPartition(HistogramPartition(self.sample, bins=[7, 5]).run()))
+
+    def test_save_load(self):
+        for partition in [FittedPartition.fit(self.sample, delta, 2, 2).partition,
+                          HistogramPartition(self.sample, bins=[7, 5]).run()]:
+            buffer = io.BytesIO()
+            FittedPartition(partition).save(buffer)
+            buffer.seek(0)
+            loaded = FittedPartition.load(buffer)
+            self.assertIs(type(loaded.partition), type(partition))
+            np.testing.assert_array_equal(loaded.assign(self.points), FittedPartition(partition).assign(self.points))
+
+    def test_estimates(self):
+        fitted = FittedPartition.fit(self.sample, delta, 2, 2)
+        self.assertAlmostEqual(fitted.mi(self.sample), kl_estimate(Plane(self.sample), fitted.partition))
+        self.assertGreater(fitted.mi(self.points), 0.1)
+
+        density = fitted.density(self.points)
+        self.assertTrue(np.all(density[fitted.assign(self.points) < 0] == 0))
+        p = fitted.partition
+        total = np.sum(p.counts / p.counts.sum())
+        self.assertAlmostEqual(np.sum(fitted.density(np.column_stack(((p.xlo + p.xhi) / 2, (p.ylo + p.yhi) / 2))) *
+                                      (p.xhi - p.xlo) * (p.yhi - p.ylo)), total)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+from scipy.stats import chi2
+
+from divergence_utils import kl_estimate
+from lag_scan import SeriesRanks, lag_scan
+from partition import AdaptiveAlgorithm, Plane
+
+
+def delta(x):
+    return chi2.ppf(0.97, x ** 2 - 1)
+
+
+class TestLagScan(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(4)
+        self.x = rng.normal(size=1200)
+        self.y = np.roll(self.x, 3) + 0.5 * rng.normal(size=1200)
+
+    def test_window(self):
+        series = SeriesRanks.from_series(np.round(self.x, 1))
+        for start, stop in [(0, 1200), (5, 1000), (300, 301)]:
+            window = series.values[start:stop]
+            sorted_values, ranks = series.window(start, stop)
+            np.testing.assert_array_equal(sorted_values, np.sort(window))
+            np.testing.assert_array_equal(ranks, np.searchsorted(np.sort(window), window, side='left'))
+
+    def test_lags(self):
+        lags = [-2, 0, 3, 7]
+        estimates = lag_scan(self.x, self.y, lags, delta)
+        for lag, estimate in zip(lags, estimates):
+            if lag >= 0:
+                sample = np.column_stack((self.x[:len(self.x) - lag], self.y[lag:]))
+            else:
+                sample = np.column_stack((self.x[-lag:], self.y[:len(self.y) + lag]))
+
+            expected = kl_estimate(Plane(sample), AdaptiveAlgorithm(sample, delta, 2, 2).run())
+            self.assertAlmostEqual(estimate, expected)
+
+        self.assertEqual(np.argmax(estimates), 2)
+
+    def test_workers(self):
+        lags = range(-3, 4)
+        np.testing.assert_array_equal(lag_scan(self.x, self.y, lags, delta, workers=2),
+                                      lag_scan(self.x, self.y, lags, delta))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+import numpy as np
+from scipy.stats import chi2
+
+from divergence_utils import kl_estimate
+from mi_matrix import mi_matrix
+from partition import AdaptiveAlgorithm, Plane
+
+
+def delta(x):
+    return chi2.ppf(0.97, x ** 2 - 1)
+
+
+class TestMIMatrix(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(5)
+        self.data = rng.normal(size=(1500, 4))
+        self.data[:, 1] += self.data[:, 0]
+        self.data[:, 3] = np.cos(self.data[:, 2]) + 0.2 * self.data[:, 3]
+
+    def test_pairs(self):
+        matrix = mi_matrix(self.data, delta)
+        np.testing.assert_array_equal(matrix, matrix.T)
+        self.assertTrue(np.all(np.isnan(np.diag(matrix))))
+        for i, j in [(0, 1), (0, 2), (2, 3)]:
+            sample = self.data[:, [i, j]]
+            expected = kl_estimate(Plane(sample), AdaptiveAlgorithm(sample, delta, 2, 2).run())
+            self.assertAlmostEqual(matrix[i, j], expected)
+
+    def test_workers(self):
+        np.testing.assert_array_equal(mi_matrix(self.data, delta, workers=2), mi_matrix(self.data, delta))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.stats import chi2
+
+from divergence_utils import kl_estimate
+from out_of_core import OutOfCoreAdaptiveAlgorithm, approximation_report, linear_quantiles
+from partition import BatchedAdaptiveAlgorithm, Plane
+from streaming import SortedRuns
+
+
+def delta(x):
+    return chi2.ppf(0.97, x ** 2 - 1)
+
+
+def as_cells(partition):
+    return sorted((*cell.xlim, *cell.ylim, cell.n_samples) for cell in partition)
+
+
+class TestOutOfCoreAdaptiveAlgorithm(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(6)
+        self.sample = rng.multivariate_normal(np.zeros(2), [[1., 0.7], [0.7, 1.]], size=3000)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "sample.npy")
+        np.save(self.path, self.sample)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_linear_quantiles(self):
+        marginal = SortedRuns()
+        for chunk in np.array_split(self.sample[:, 0], 5):
+            marginal.insert(chunk)
+
+        quantiles = np.arange(1, 7) / 7
+        np.testing.assert_array_equal(linear_quantiles(marginal, quantiles), np.quantile(self.sample[:, 0], quantiles))
+
+    def test_same_partition(self):
+        for r, s, budget in [(2, 2, 2 ** 14), (3, 5, 2 ** 16), (4, 2, 2 ** 12)]:
+            algorithm = OutOfCoreAdaptiveAlgorithm(self.path, delta, r, s, memory_budget=budget)
+            result = algorithm.run()
+            expected = BatchedAdaptiveAlgorithm(self.sample, delta, r, s).run()
+            self.assertEqual(as_cells(result), as_cells(expected))
+            self.assertAlmostEqual(algorithm.estimate(), kl_estimate(Plane(self.sample), expected), places=12)
+            self.assertGreater(algorithm.n_passes, 2)
+
+    def test_sketched_partition(self):
+        # Sketches larger than the sample summarize it exactly
+        for r, s in [(2, 2), (3, 5)]:
+            algorithm = OutOfCoreAdaptiveAlgorithm(self.path, delta, r, s, memory_budget=2 ** 14,
+                                                   quantile_error=0.0005)
+            result = algorithm.run()
+            expected = BatchedAdaptiveAlgorithm(self.sample, delta, r, s).run()
+            self.assertEqual(as_cells(result), as_cells(expected))
+            self.assertAlmostEqual(algorithm.estimate(), kl_estimate(Plane(self.sample), expected), places=12)
+
+    def test_approximation_report(self):
+        report = approximation_report(self.sample, delta, 2, 2, quantile_errors=(0.05, 0.01), seed=0)
+        self.assertEqual([row["quantile_error"] for row in report], [None, 0.05, 0.01])
+        self.assertEqual(report[0]["deviation"], 0.)
+        for row in report[1:]:
+            self.assertLess(abs(row["deviation"]), 0.05)
+            self.assertEqual(row["deviation"], row["estimate"] - report[0]["estimate"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+import unittest
+
+import numpy as np
+from scipy.stats import chi2
+
+from partition import (AdaptiveAlgorithm, BatchedAdaptiveAlgorithm, HistogramPartition, NonAdaptivePartition, Partition, Plane,
+                       RankAdaptiveAlgorithm)
+
+
+def delta(x):
+    return chi2.ppf(0.97, x ** 2 - 1)
+
+
+def gaussian_sample(n, rho, seed=1):
+    rng = np.random.RandomState(seed)
+    return rng.multivariate_normal(np.zeros(2), [[1., rho], [rho, 1.]], size=n)
+
+
+def as_cells(partition):
+    return sorted((*rect.xlim, *rect.ylim, rect.n_samples) for rect in partition)
+
+
+class TestPlane(unittest.TestCase):
+
+    def test_strip_quantiles(self):
+        sample = gaussian_sample(500, 0.5)
+        plane = Plane(sample)
+        xlim = [-0.5, 1.2]
+        strip = plane.get_samples(xlim, plane.ylim)[:, 0]
+        for size in [2, 3, 4, 10]:
+            expected = [np.quantile(strip, j / size, interpolation='lower') for j in range(1, size)]
+            np.testing.assert_array_equal(plane.strip_quantiles(xlim, 0, size), expected)
+
+    def test_count(self):
+        rng = np.random.RandomState(2)
+        for n in [1, 5, 64, 777]:
+            sample = gaussian_sample(n, 0.7, seed=n)
+            sample[:n // 3, 1] = np.round(sample[:n // 3, 1], 1)
+            plane = Plane(sample)
+            self.assertEqual(plane.count(plane.xlim, plane.ylim), n)
+            for _ in range(50):
+                xlim, ylim = np.sort(rng.normal(size=2)), np.sort(rng.normal(size=2))
+                self.assertEqual(plane.count(xlim, ylim), len(plane.get_samples(xlim, ylim)))
+                self.assertEqual(plane.strip_count(xlim, 0), len(plane.get_samples(xlim, plane.ylim)))
+
+    def test_count_grid(self):
+        sample = gaussian_sample(400, -0.4)
+        plane = Plane(sample)
+        xpart, ypart = [-3., -1., 0., 0.5, 4.], [-2., 0., 2.]
+        expected = [[len(plane.get_samples(xpart[i:i + 2], ypart[j:j + 2])) for j in range(2)] for i in range(4)]
+        np.testing.assert_array_equal(plane.count_grid(xpart, ypart), expected)
+
+
+class TestAdaptiveAlgorithm(unittest.TestCase):
+
+    def test_subpartition_cache(self):
+        sample = gaussian_sample(800, 0.8)
+        algorithm = AdaptiveAlgorithm(sample, delta, 2, 3)
+        algorithm.initialize_partition()
+        for rect in algorithm.current_partition:
+            cache = {}
+            algorithm.subpartition(rect, 9, cache)
+            xpartition, ypartition, child = algorithm.subpartition(rect, 3, cache)
+            expected_x, expected_y = algorithm.subpartition_limits(rect, 3)
+            np.testing.assert_array_equal(xpartition, expected_x)
+            np.testing.assert_array_equal(ypartition, expected_y)
+            np.testing.assert_array_equal(child, algorithm.subpartition(rect, 3, {})[2])
+
+    def test_split_rectangle(self):
+        sample = gaussian_sample(500, 0.5)
+        algorithm = AdaptiveAlgorithm(sample, delta, 3, 2)
+        algorithm.initialize_partition()
+        rect = algorithm.current_partition[4]
+        children = algorithm.split_rectangle(rect, *algorithm.subpartition(rect, 3, {}))
+        for child in children:
+            np.testing.assert_array_equal(child.samples_inside, algorithm.plane.get_samples(child.xlim, child.ylim))
+
+
+class TestRankAdaptiveAlgorithm(unittest.TestCase):
+
+    def test_same_partition(self):
+        for rho, (r, s) in [(0., (2, 2)), (0.6, (2, 2)), (0.9, (4, 2)), (0.9, (3, 5))]:
+            sample = gaussian_sample(1000, rho)
+            expected = AdaptiveAlgorithm(sample, delta, r, s).run()
+            result = RankAdaptiveAlgorithm(sample, delta, r, s).run()
+            self.assertEqual(as_cells(result), as_cells(expected))
+
+    def test_samples_inside(self):
+        sample = gaussian_sample(300, 0.3)
+        algorithm = RankAdaptiveAlgorithm(sample, delta, 2, 2)
+        algorithm.initialize_partition()
+        for parent in algorithm.current_partition:
+            for rect in algorithm.rectangle_subpartition(parent, 3)[0]:
+                expected = algorithm.plane.get_samples(rect.xlim, rect.ylim)
+                np.testing.assert_array_equal(np.sort(rect.samples_inside, axis=0), np.sort(expected, axis=0))
+
+
+class TestBatchedAdaptiveAlgorithm(unittest.TestCase):
+
+    def test_same_partition(self):
+        for rho, (r, s) in [(0., (2, 2)), (0.6, (2, 2)), (0.9, (4, 2)), (0.9, (3, 5))]:
+            sample = gaussian_sample(1000, rho)
+            expected = AdaptiveAlgorithm(sample, delta, r, s).run()
+            result = BatchedAdaptiveAlgorithm(sample, delta, r, s).run()
+            self.assertEqual([(*rect.xlim, *rect.ylim, rect.n_samples) for rect in result],
+                             [(*rect.xlim, *rect.ylim, rect.n_samples) for rect in expected])
+
+    def test_index(self):
+        sample = gaussian_sample(300, 0.3)
+        plane = Plane(sample)
+        algorithm = BatchedAdaptiveAlgorithm(sample, delta, 2, 2)
+        partition = algorithm.run()
+        bounds = np.concatenate(([0], np.cumsum(partition.counts)))
+        for i, cell in enumerate(partition):
+            expected = plane.get_samples(cell.xlim, cell.ylim)
+            result = sample[algorithm.index[bounds[i]:bounds[i + 1]]]
+            np.testing.assert_array_equal(np.sort(result, axis=0), np.sort(expected, axis=0))
+
+    def test_stats(self):
+        sample = gaussian_sample(3000, 0.8)
+        _, expected = AdaptiveAlgorithm(sample, delta, 2, 2).run(stats=True)
+        levels = []
+        partition, stats = BatchedAdaptiveAlgorithm(sample, delta, 2, 2).run(stats=True, on_level=levels.append)
+        self.assertEqual(levels, stats.levels)
+        self.assertEqual(stats.depth, expected.depth)
+        counters = ["frontier", "tests_s", "tests_s2", "passed_s", "passed_s2", "next_frontier"]
+        for level, expected_level in zip(stats.levels, expected.levels):
+            self.assertEqual([getattr(level, name) for name in counters],
+                             [getattr(expected_level, name) for name in counters])
+
+        self.assertEqual(stats.levels[-1].next_frontier, 0)
+        self.assertEqual(len(partition), sum(level.frontier - level.splits for level in stats.levels) +
+                         sum(4 * level.splits - level.next_frontier for level in stats.levels))
+        self.assertEqual(len(stats.as_dict()["levels"]), stats.depth)
+
+    def test_parent(self):
+        sample = gaussian_sample(2000, 0.8)
+        partition = BatchedAdaptiveAlgorithm(sample, delta, 2, 2).run()
+        self.assertEqual(len(partition.parent), len(partition))
+        self.assertLessEqual(np.sum(partition.parent == -1), 4)
+        for parent in np.unique(partition.parent[partition.parent >= 0]):
+            self.assertLessEqual(np.sum(partition.parent == parent), 4)
+
+
+class TestPartition(unittest.TestCase):
+
+    def setUp(self):
+        self.sample = gaussian_sample(1000, 0.5)
+        self.rectangles = NonAdaptivePartition(self.sample, bins=[4, 3]).points_to_partition(
+            [-5., -1., 0., 1., 5.], [-5., 0., 0.5, 5.])
+        self.partition = Partition.from_rectangles(self.rectangles)
+
+    def test_from_rectangles(self):
+        self.assertEqual(len(self.partition), 12)
+        self.assertEqual(self.partition.counts.sum(), 1000)
+        self.assertEqual(self.partition.xlo.dtype, np.float64)
+        self.assertEqual(self.partition.counts.dtype, np.int64)
+
+    def test_views(self):
+        for cell, rect in zip(self.partition, self.rectangles):
+            self.assertEqual(cell.xlim, rect.xlim)
+            self.assertEqual(cell.ylim, rect.ylim)
+            self.assertEqual(cell.n_samples, rect.n_samples)
+
+        self.assertEqual(self.partition[-1].xlim, self.rectangles[-1].xlim)
+
+    def test_slicing(self):
+        part = self.partition[2:5]
+        self.assertIsInstance(part, Partition)
+        np.testing.assert_array_equal(part.counts, self.partition.counts[2:5])
+        part = self.partition[self.partition.counts > 50]
+        self.assertTrue(np.all(part.counts > 50))
+
+    def test_plot_rect(self):
+        self.assertEqual(len(self.partition.get_plot_rect().get_segments()), 4 * len(self.partition))
+
+
+class TestPartitionTree(unittest.TestCase):
+
+    def setUp(self):
+        self.sample = gaussian_sample(3000, 0.7)
+
+    def test_leaves(self):
+        for r, s in [(2, 2), (3, 2), (4, 4)]:
+            algorithm = BatchedAdaptiveAlgorithm(self.sample, delta, r, s)
+            partition = algorithm.run()
+            tree = algorithm.tree
+            self.assertEqual(np.count_nonzero(tree.cell >= 0), len(partition))
+            self.assertEqual(as_cells(tree.prune()), as_cells(partition))
+
+            leaves = np.flatnonzero(tree.cell >= 0)
+            np.testing.assert_array_equal(tree.counts[leaves], partition.counts[tree.cell[leaves]])
+            split = np.flatnonzero(tree.first_child >= 0)
+            children = tree.first_child[split, None] + np.arange(r ** 2)
+            np.testing.assert_array_equal(tree.counts[children].sum(axis=1), tree.counts[split])
+            self.assertTrue(np.all(tree.depth[children] == tree.depth[split, None] + 1))
+
+    def test_locate(self):
+        algorithm = BatchedAdaptiveAlgorithm(self.sample, delta, 2, 2)
+        partition = algorithm.run()
+        points = gaussian_sample(2000, 0.2, seed=2) * 1.5
+        cell = algorithm.tree.locate_cells(points)
+        inside = ((points[:, 0, None] >= partition.xlo) & (points[:, 0, None] < partition.xhi) &
+                  (points[:, 1, None] >= partition.ylo) & (points[:, 1, None] < partition.yhi))
+        np.testing.assert_array_equal(inside.sum(axis=1), (cell >= 0).astype(int))
+        np.testing.assert_array_equal(np.argmax(inside, axis=1)[cell >= 0], cell[cell >= 0])
+
+        cell = algorithm.tree.locate_cells(self.sample)
+        np.testing.assert_array_equal(np.bincount(cell, minlength=len(partition)), partition.counts)
+
+    def test_prune(self):
+        algorithm = BatchedAdaptiveAlgorithm(self.sample, delta, 2, 2)
+        algorithm.run()
+        tree = algorithm.tree
+        plane = Plane(self.sample)
+        for max_depth, min_count in [(1, None), (2, None), (None, 300), (3, 100)]:
+            pruned = tree.prune(max_depth=max_depth, min_count=min_count)
+            self.assertEqual(pruned.counts.sum(), len(self.sample))
+            for cell in pruned:
+                self.assertEqual(cell.n_samples, plane.count(cell.xlim, cell.ylim))
+
+        self.assertEqual(len(tree.prune(max_depth=1)), 4)
+        self.assertLess(len(tree.prune(min_count=300)), len(tree.prune()))
+
+
+class TestHistogramPartition(unittest.TestCase):
+
+    def test_same_partition(self):
+        sample = gaussian_sample(2000, 0.6)
+        for bins in [[1, 1], [5, 5], [50, 20]]:
+            expected = NonAdaptivePartition(sample, bins=bins).run()
+            result = HistogramPartition(sample, bins=bins).run()
+            self.assertEqual(len(result), len(expected))
+            self.assertEqual([(*cell.xlim, *cell.ylim, cell.n_samples) for cell in result],
+                             [(*rect.xlim, *rect.ylim, rect.n_samples) for rect in expected])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+from scipy.stats import chi2
+
+from divergence_utils import kl_estimate
+from partition import AdaptiveAlgorithm, Plane, tabulate_delta
+from permutation import PermutationEstimator, permutation_test
+
+
+def delta(x):
+    return chi2.ppf(0.97, x ** 2 - 1)
+
+
+class TestPermutation(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(8)
+        self.dependent = rng.multivariate_normal([0, 0], [[1, 0.5], [0.5, 1]], size=600)
+        self.independent = rng.normal(size=(600, 2))
+
+    def test_permuted(self):
+        estimator = PermutationEstimator.from_sample(self.dependent, tabulate_delta(delta, 2), 2, 2, np.exp(1))
+        perm = np.random.default_rng(4).permutation(600)
+        for sample, yrank in [(self.dependent, estimator.yrank),
+                              (np.column_stack((self.dependent[:, 0], self.dependent[perm, 1])), estimator.yrank[perm])]:
+            expected = kl_estimate(Plane(sample), AdaptiveAlgorithm(sample, delta, 2, 2).run())
+            self.assertAlmostEqual(estimator(yrank), expected)
+
+    def test_early_stop(self):
+        result = permutation_test(self.dependent, delta, n_permutations=500, batch_size=50, seed=1)
+        self.assertTrue(result.rejected)
+        self.assertEqual(result.exceedances, 0)
+        self.assertLess(result.n_permutations, 500)
+        self.assertEqual(result.n_permutations % 50, 0)
+
+        result = permutation_test(self.independent, delta, n_permutations=500, batch_size=50, seed=1)
+        self.assertFalse(result.rejected)
+        self.assertLess(result.n_permutations, 500)
+
+        full = permutation_test(self.dependent, delta, n_permutations=120, batch_size=50, early_stop=False, seed=1)
+        self.assertEqual(full.n_permutations, 120)
+
+    def test_workers(self):
+        serial = permutation_test(self.independent, delta, n_permutations=60, early_stop=False, seed=2)
+        parallel = permutation_test(self.independent, delta, n_permutations=60, early_stop=False, seed=2,
+                                    batch_size=25, workers=2, chunksize=4)
+        np.testing.assert_array_equal(serial.null, parallel.null)
+        self.assertEqual(serial.p_value, parallel.p_value)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+import numpy as np
+
+from sketch import KLLSketch, StripSketches
+
+
+class TestKLLSketch(unittest.TestCase):
+
+    def test_rank_error(self):
+        rng = np.random.RandomState(0)
+        values = rng.normal(size=200000)
+        sketch = KLLSketch(error=0.01, seed=0)
+        for chunk in np.array_split(values, 40):
+            sketch.insert(chunk)
+
+        self.assertEqual(len(sketch), len(values))
+        self.assertLess(sum(map(len, sketch.compactors)), 4 * sketch.k)
+        queries = np.quantile(values, np.linspace(0.01, 0.99, 50))
+        exact = np.searchsorted(np.sort(values), queries)
+        self.assertLess(np.max(np.abs(sketch.rank(queries) - exact)), 0.01 * len(values))
+
+    def test_merge(self):
+        rng = np.random.RandomState(1)
+        values = rng.uniform(size=50000)
+        sketches = [KLLSketch(error=0.02, seed=seed) for seed in range(2)]
+        sketches[0].insert(values[:20000])
+        sketches[1].insert(values[20000:])
+        sketches[0].merge(sketches[1])
+
+        self.assertEqual(len(sketches[0]), len(values))
+        median = sketches[0].select(len(values) // 2)
+        self.assertLess(abs(np.mean(values < median) - 0.5), 0.02)
+
+    def test_small_sketch_is_exact(self):
+        values = np.random.RandomState(2).normal(size=500)
+        sketch = KLLSketch(error=0.001)
+        sketch.insert(values)
+        np.testing.assert_array_equal(sketch.select(np.arange(500)), np.sort(values))
+
+
+class TestStripSketches(unittest.TestCase):
+
+    def test_strips(self):
+        values = np.random.RandomState(3).normal(size=1000)
+        strips = StripSketches(error=0.001)
+        strips.reset([-np.inf, -np.inf], [np.inf, np.inf], np.array([[-1., 0.5], [-1., 0.5]]))
+        strips.add(values[:400])
+        strips.add(values[400:])
+        strips.finish()
+
+        np.testing.assert_array_equal(strips.strip_sizes([-np.inf, -1., 0.5, 0.5], [-1., 0.5, np.inf, 0.5]),
+                                      [np.sum(values < -1), np.sum((values >= -1) & (values < 0.5)),
+                                       np.sum(values >= 0.5), 0])
+        middle = np.sort(values[(values >= -1) & (values < 0.5)])
+        expected = middle[np.floor((len(middle) - 1) * np.arange(1, 4) / 4).astype(int)]
+        np.testing.assert_array_equal(strips.strip_quantiles([-1.], [0.5], 4), [expected])
+
+
+if __name__ == "__main__":
+    unittest.main()
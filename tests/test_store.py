@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from experiments import MLEstimator, run_replicates, summarize
+from store import ResultStore
+from table_gen import as_results
+
+
+class CountingEstimator(MLEstimator):
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, sample):
+        self.calls += 1
+        return [super().__call__(sample), np.mean(sample)]
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "results.jsonl")
+        self.rhos = [0., 0.6]
+        self.sample_sizes = [100, 200]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_reload(self):
+        store = ResultStore(self.path)
+        store.record(0.3, 250, 0, {"ML": 0.1, "CI": 0.2})
+        store.record(0.3, 250, 1, {"ML": 0.3})
+        with open(self.path, 'a') as f:
+            f.write('{"rho": 0.3, "n": 250, "k": 1, "met')
+
+        store = ResultStore(self.path)
+        self.assertEqual(len(store), 3)
+        self.assertTrue(store.done(0.3, 250, 0, ["ML", "CI"]))
+        self.assertFalse(store.done(0.3, 250, 1, ["ML", "CI"]))
+        self.assertEqual(store.get(0.3, 250, 1, "ML"), 0.3)
+
+    def test_resume(self):
+        names = ["ML", "mean"]
+        method = CountingEstimator()
+        run_replicates([method], self.rhos, self.sample_sizes, 2, store=ResultStore(self.path), names=names)
+        self.assertEqual(method.calls, 8)
+
+        # The first replicates of a cell do not depend on K, only the new ones are computed
+        method = CountingEstimator()
+        store = ResultStore(self.path)
+        values = run_replicates([method], self.rhos, self.sample_sizes, 3, store=store, names=names)
+        self.assertEqual(method.calls, 4)
+        np.testing.assert_array_equal(values, run_replicates([CountingEstimator()], self.rhos, self.sample_sizes, 3))
+
+        results, results_std = store.summarize(names)
+        expected, expected_std = summarize(values, self.rhos, self.sample_sizes)
+        self.assertEqual(results, expected)
+        self.assertEqual(results_std, expected_std)
+        self.assertEqual(as_results(store, names), expected)
+
+        with self.assertRaises(ValueError):
+            run_replicates([method], self.rhos, self.sample_sizes, 3, store=store)
+
+
+if __name__ == "__main__":
+    unittest.main()
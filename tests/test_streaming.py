@@ -0,0 +1,108 @@
+import unittest
+
+import numpy as np
+from scipy.stats import chi2
+
+from divergence_utils import kl_estimate, kl_estimate_arrays
+from partition import BatchedAdaptiveAlgorithm, Plane
+from streaming import SlidingWindowEstimator, SortedArray, SortedRuns, StreamingAdaptiveEstimator
+
+
+def delta(x):
+    return chi2.ppf(0.97, x ** 2 - 1)
+
+
+def gaussian_sample(n, rho, seed=1):
+    rng = np.random.RandomState(seed)
+    return rng.multivariate_normal(np.zeros(2), [[1., rho], [rho, 1.]], size=n)
+
+
+class TestSortedRuns(unittest.TestCase):
+
+    def test_rank_select(self):
+        rng = np.random.RandomState(0)
+        runs = SortedRuns()
+        values = []
+        for size in [100, 3, 50, 1, 400, 7, 7, 7]:
+            batch = np.round(rng.normal(size=size), 1)
+            runs.insert(batch)
+            values.extend(batch)
+
+        values = np.sort(values)
+        self.assertEqual(len(runs), len(values))
+        self.assertLessEqual(len(runs.runs), 4)
+        np.testing.assert_array_equal(runs.select(np.arange(len(values))), values)
+        queries = np.array([-np.inf, -1., 0., 0.05, 2., np.inf])
+        np.testing.assert_array_equal(runs.rank(queries), np.searchsorted(values, queries, side='left'))
+
+    def test_sorted_array(self):
+        rng = np.random.RandomState(0)
+        array = SortedArray()
+        values = np.round(rng.normal(size=300), 1)
+        array.insert(values[:200])
+        array.remove(values[:100])
+        array.insert(values[200:])
+        expected = np.sort(values[100:])
+        np.testing.assert_array_equal(array.runs[0], expected)
+        np.testing.assert_array_equal(array.select(np.arange(200)), expected)
+
+
+class TestStreamingAdaptiveEstimator(unittest.TestCase):
+
+    def test_first_batch(self):
+        sample = gaussian_sample(2000, 0.7)
+        for r, s in [(2, 2), (3, 5)]:
+            estimator = StreamingAdaptiveEstimator(delta, r, s)
+            expected = BatchedAdaptiveAlgorithm(sample, delta, r, s).run()
+            self.assertAlmostEqual(estimator.update(sample), kl_estimate(Plane(sample), expected), places=12)
+            self.assertEqual(len(estimator.partition()), len(expected))
+
+    def test_updates(self):
+        sample = gaussian_sample(6000, 0.8)
+        estimator = StreamingAdaptiveEstimator(delta, 2, 2)
+        for start in range(0, len(sample), 1500):
+            estimate = estimator.update(sample[start:start + 1500])
+            seen = sample[:start + 1500]
+            partition = estimator.partition()
+
+            self.assertEqual(partition.counts.sum(), len(seen))
+            for cell in partition[::7]:
+                inside = ((seen[:, 0] >= cell.xlim[0]) & (seen[:, 0] < cell.xlim[1]) &
+                          (seen[:, 1] >= cell.ylim[0]) & (seen[:, 1] < cell.ylim[1]))
+                self.assertEqual(np.sum(inside), cell.n_samples)
+
+            expected = kl_estimate_arrays(Plane(seen), partition.xlo, partition.xhi, partition.ylo, partition.yhi,
+                                          partition.counts)
+            self.assertAlmostEqual(estimate, expected, places=10)
+
+
+class TestSlidingWindowEstimator(unittest.TestCase):
+
+    def test_windows(self):
+        rng = np.random.RandomState(3)
+        rho = np.linspace(0., 0.9, 12000)
+        z = rng.normal(size=(12000, 2))
+        data = np.column_stack([z[:, 0], rho * z[:, 0] + np.sqrt(1 - rho ** 2) * z[:, 1]])
+        window, step = 3000, 1000
+
+        estimator = SlidingWindowEstimator(delta, 2, 2, window, step)
+        estimates = []
+        for end, estimate in zip(range(window, len(data) + 1, step), estimator.run(data)):
+            seen = data[end - window:end]
+            partition = estimator.partition()
+            self.assertEqual(partition.counts.sum(), window)
+            expected = kl_estimate_arrays(Plane(seen), partition.xlo, partition.xhi, partition.ylo, partition.yhi,
+                                          partition.counts)
+            self.assertAlmostEqual(estimate, expected, places=10)
+            estimates.append(estimate)
+
+        self.assertEqual(len(estimates), 10)
+        self.assertLess(estimates[0], estimates[-1])
+
+    def test_step_larger_than_window(self):
+        with self.assertRaises(ValueError):
+            SlidingWindowEstimator(delta, 2, 2, 100, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
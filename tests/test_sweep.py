@@ -0,0 +1,41 @@
+import unittest
+
+import numpy as np
+from scipy.stats import chi2
+
+from divergence_utils import kl_estimate
+from partition import AdaptiveAlgorithm, Plane
+from sweep import ConfigurationSweep, sweep
+
+
+def delta(x):
+    return chi2.ppf(0.97, x ** 2 - 1)
+
+
+def loose_delta(x):
+    return chi2.ppf(0.9, x ** 2 - 1)
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(9)
+        self.sample = rng.multivariate_normal([0, 0], [[1, 0.7], [0.7, 1]], size=2000)
+
+    def test_configurations(self):
+        configs = [(2, 2, delta), (4, 4, delta), (5, 5, delta), (10, 10, delta), (3, 2, loose_delta), (2, 2, delta)]
+        estimates = sweep(self.sample, configs)
+        self.assertEqual(estimates.shape, (6,))
+        for (r, s, d), estimate in zip(configs, estimates):
+            expected = kl_estimate(Plane(self.sample), AdaptiveAlgorithm(self.sample, d, r, s).run())
+            self.assertAlmostEqual(estimate, expected)
+
+    def test_initial_splits(self):
+        splits = ConfigurationSweep([(r, r, delta) for r in [2, 4, 5, 10]]).initial_splits(self.sample)
+        for r in [2, 4, 5, 10]:
+            np.testing.assert_array_equal(splits[r][0], np.quantile(self.sample[:, 0], np.arange(1, r) / r))
+            np.testing.assert_array_equal(splits[r][1], np.quantile(self.sample[:, 1], np.arange(1, r) / r))
+
+
+if __name__ == "__main__":
+    unittest.main()